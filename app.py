@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import folium
+from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 import json
 from datetime import datetime
@@ -8,6 +9,7 @@ from datetime import datetime
 # Importar módulos do projeto
 from db_sqlite import SQLiteDB
 from db_mongo import MongoDB
+from db_mongo_async import MongoDBAsync, ExecutorAssincrono
 from geoprocessamento import GeoProcessamento
 
 # Configuração da página
@@ -33,6 +35,35 @@ def init_databases():
 
 sqlite_db, mongo_db = init_databases()
 
+@st.cache_resource
+def init_mongo_async():
+    """Inicializa o cliente assíncrono do MongoDB e o laço de eventos que o executa"""
+    return MongoDBAsync(), ExecutorAssincrono()
+
+mongo_async, executor_async = init_mongo_async()
+
+# Bancos antigos com cidades repetidas ficam sem o índice único até a mesclagem explícita
+if sqlite_db.cidades_duplicadas:
+    st.warning(
+        f"⚠️ {len(sqlite_db.cidades_duplicadas)} cidades aparecem mais de uma vez no mesmo estado; "
+        "o índice único (nome, estado) não foi criado. Revise e mescle as duplicatas."
+    )
+    with st.expander("Ver cidades duplicadas"):
+        st.dataframe(pd.DataFrame(sqlite_db.cidades_duplicadas), use_container_width=True)
+        if st.button("Mesclar cidades duplicadas"):
+            removidas = sqlite_db.mesclar_cidades_duplicadas()
+            st.success(f"✅ {removidas} cidades repetidas mescladas e índice único criado!")
+
+def tabela_locais(locais):
+    """Monta o DataFrame de uma lista de locais, com as coordenadas em colunas latitude/longitude"""
+    df = pd.DataFrame(locais)
+    if 'coordenadas' in df.columns:
+        # Locais sem coordenadas ficam com latitude/longitude vazias
+        coordenadas = [c if isinstance(c, dict) else {} for c in df.pop('coordenadas')]
+        df['latitude'] = [c.get('latitude') for c in coordenadas]
+        df['longitude'] = [c.get('longitude') for c in coordenadas]
+    return df
+
 # Sidebar para navegação
 st.sidebar.title("📋 Menu")
 pagina = st.sidebar.selectbox(
@@ -63,11 +94,11 @@ if pagina == "🏠 Início":
         - Consultas SQL tradicionais
         """)
         
-        # Estatísticas do SQLite
-        cidades = sqlite_db.get_cidades()
+        # Estatísticas do SQLite (contagem por estado já mantida em estado_resumo)
+        total_cidades = sum(resumo['quantidade_cidades'] for resumo in sqlite_db.get_resumo_estados())
         estados = sqlite_db.get_estados()
         
-        st.metric("Total de Cidades", len(cidades))
+        st.metric("Total de Cidades", total_cidades)
         st.metric("Total de Estados", len(estados))
     
     with col2:
@@ -79,27 +110,57 @@ if pagina == "🏠 Início":
         - Consultas espaciais
         """)
         
-        # Estatísticas do MongoDB
-        locais = mongo_db.get_all_locais()
-        st.metric("Total de Locais", len(locais))
+        # Estatísticas do MongoDB (contagens feitas no servidor, sem ler os locais)
+        total_locais = mongo_db.contar_locais()
         
-        if locais:
-            categorias = set(local.get('categoria', 'N/A') for local in locais)
-            st.metric("Categorias", len(categorias))
+        st.metric("Total de Locais", total_locais)
+        
+        if total_locais:
+            st.metric("Categorias", len(mongo_db.contar_por_campo("categoria")))
 
 # Página de Gerenciamento de Cidades (SQLite)
 elif pagina == "🏙️ Gerenciar Cidades (SQLite)":
     st.header("🏙️ Gerenciamento de Cidades (SQLite)")
     
-    tab1, tab2, tab3 = st.tabs(["📋 Listar Cidades", "➕ Adicionar Cidade", "📊 Dados de Exemplo"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 Listar Cidades", "➕ Adicionar Cidade", "📊 Dados de Exemplo",
+                                      "🔎 Filtrar Cidades"])
     
     with tab1:
         st.subheader("Lista de Cidades")
-        cidades = sqlite_db.get_cidades()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            tamanho_pagina = st.selectbox("Itens por página", [25, 50, 100], index=1, key="tamanho_cidades")
+        with col2:
+            ordenar_por = st.selectbox("Ordenar por", ["nome", "id"], key="ordem_cidades")
+        with col3:
+            decrescente = st.checkbox("Decrescente", key="decrescente_cidades")
+        
+        # Pilha com o cursor de cada página visitada (reiniciada ao mudar as opções)
+        opcoes = (tamanho_pagina, ordenar_por, decrescente)
+        if st.session_state.get("opcoes_cidades") != opcoes:
+            st.session_state["opcoes_cidades"] = opcoes
+            st.session_state["cursores_cidades"] = [None]
+        cursores = st.session_state["cursores_cidades"]
+        
+        cidades, proximo = sqlite_db.listar_cidades_pagina(tamanho_pagina, cursores[-1],
+                                                           ordenar_por, decrescente)
         
         if cidades:
             df_cidades = pd.DataFrame(cidades)
             st.dataframe(df_cidades, use_container_width=True)
+            
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                if st.button("⬅️ Anterior", disabled=len(cursores) == 1, key="anterior_cidades"):
+                    cursores.pop()
+                    st.rerun()
+            with col2:
+                if st.button("Próxima ➡️", disabled=proximo is None, key="proxima_cidades"):
+                    cursores.append(proximo)
+                    st.rerun()
+            with col3:
+                st.caption(f"Página {len(cursores)}")
         else:
             st.info("Nenhuma cidade cadastrada. Use a aba 'Adicionar Cidade' ou 'Dados de Exemplo'.")
     
@@ -116,12 +177,23 @@ elif pagina == "🏙️ Gerenciar Cidades (SQLite)":
             populacao = st.number_input("População", min_value=0, value=0)
             area_km2 = st.number_input("Área (km²)", min_value=0.0, value=0.0)
         
+        informar_coordenadas = st.checkbox("Informar coordenadas")
+        if informar_coordenadas:
+            col1, col2 = st.columns(2)
+            with col1:
+                latitude_cidade = st.number_input("Latitude", format="%.6f", value=-7.11532, key="lat_nova_cidade")
+            with col2:
+                longitude_cidade = st.number_input("Longitude", format="%.6f", value=-34.861, key="lon_nova_cidade")
+        else:
+            latitude_cidade = longitude_cidade = None
+        
         if st.button("Adicionar Cidade", type="primary"):
             if nome_cidade and estado_uf:
                 try:
                     cidade_id = sqlite_db.insert_cidade(nome_cidade, estado_uf.upper(), 
                                                       populacao if populacao > 0 else None,
-                                                      area_km2 if area_km2 > 0 else None)
+                                                      area_km2 if area_km2 > 0 else None,
+                                                      latitude_cidade, longitude_cidade)
                     st.success(f"Cidade '{nome_cidade}' adicionada com sucesso! ID: {cidade_id}")
                     st.rerun()
                 except Exception as e:
@@ -138,28 +210,103 @@ elif pagina == "🏙️ Gerenciar Cidades (SQLite)":
                 sqlite_db.populate_sample_data()
             st.success("Dados de exemplo adicionados com sucesso!")
             st.rerun()
+        
+        st.subheader("Importar Municípios (CSV)")
+        st.markdown("Colunas `nome` e `uf` e, opcionalmente, `populacao`, `area_km2`, `latitude` e `longitude`. "
+                    "Cidades já cadastradas no mesmo estado são atualizadas.")
+        
+        arquivo_cidades = st.file_uploader("Arquivo CSV", type=["csv"], key="csv_cidades")
+        if arquivo_cidades is not None and st.button("Importar Municípios", type="primary"):
+            with st.spinner("Importando municípios..."):
+                resumo = sqlite_db.importar_cidades_csv(arquivo_cidades)
+            st.success(f"{resumo['importadas']} cidades importadas, {resumo['rejeitadas']} linhas rejeitadas.")
+            
+            if resumo['amostra_rejeitadas']:
+                st.dataframe(pd.DataFrame(resumo['amostra_rejeitadas']), use_container_width=True)
+    
+    with tab4:
+        st.subheader("Filtrar Cidades")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            ufs = [""] + sorted(e['uf'] for e in sqlite_db.get_estados())
+            uf_filtro = st.selectbox("UF", ufs, format_func=lambda uf: uf or "Todas")
+            prefixo = st.text_input("Nome começa com")
+        with col2:
+            populacao_min, populacao_max = st.slider("População", 0, 15_000_000, (0, 15_000_000), step=10_000)
+            area_min, area_max = st.slider("Área (km²)", 0.0, 20_000.0, (0.0, 20_000.0), step=10.0)
+        with col3:
+            ordenar_filtro = st.selectbox("Ordenar por", list(SQLiteDB.ORDENACOES_FILTRO), key="ordem_filtro")
+            decrescente_filtro = st.checkbox("Decrescente", key="decrescente_filtro")
+            limite_filtro = st.number_input("Máx. resultados", min_value=1, max_value=5000, value=100)
+        
+        # Extremos dos sliders significam "sem limite"
+        filtros = dict(
+            uf=uf_filtro or None,
+            prefixo=prefixo.strip() or None,
+            populacao_min=populacao_min or None,
+            populacao_max=populacao_max if populacao_max < 15_000_000 else None,
+            area_min=area_min or None,
+            area_max=area_max if area_max < 20_000.0 else None,
+            ordenar_por=ordenar_filtro,
+            decrescente=decrescente_filtro,
+            limite=int(limite_filtro)
+        )
+        
+        df_filtradas = sqlite_db.filtrar_cidades(**filtros, formato="dataframe")
+        if not df_filtradas.empty:
+            st.write(f"**{len(df_filtradas)} cidades encontradas**")
+            st.dataframe(df_filtradas, use_container_width=True)
+        else:
+            st.info("Nenhuma cidade atende aos filtros.")
+        
+        with st.expander("Plano de consulta (EXPLAIN QUERY PLAN)"):
+            st.code("\n".join(sqlite_db.plano_filtrar_cidades(**filtros)))
 
 # Página de Gerenciamento de Locais (MongoDB)
 elif pagina == "📍 Gerenciar Locais (MongoDB)":
     st.header("📍 Gerenciamento de Locais (MongoDB)")
     
-    tab1, tab2, tab3 = st.tabs(["📋 Listar Locais", "➕ Adicionar Local", "📊 Dados de Exemplo"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📋 Listar Locais", "➕ Adicionar Local", "📊 Dados de Exemplo",
+                                            "📥 Importar Arquivo", "🔎 Buscar Locais"])
     
     with tab1:
         st.subheader("Lista de Locais")
-        locais = mongo_db.get_all_locais()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            tamanho_pagina = st.selectbox("Itens por página", [25, 50, 100], index=1, key="tamanho_locais")
+        with col2:
+            ordenar_por = st.selectbox("Ordenar por", list(MongoDB.ORDENACOES_PAGINACAO), key="ordem_locais")
+        with col3:
+            decrescente = st.checkbox("Decrescente", key="decrescente_locais")
+        
+        # Pilha com o cursor de cada página visitada (reiniciada ao mudar as opções)
+        opcoes = (tamanho_pagina, ordenar_por, decrescente)
+        if st.session_state.get("opcoes_locais") != opcoes:
+            st.session_state["opcoes_locais"] = opcoes
+            st.session_state["cursores_locais"] = [None]
+        cursores = st.session_state["cursores_locais"]
+        
+        locais, proximo = mongo_db.listar_locais_pagina(tamanho_pagina, cursores[-1],
+                                                        ordenar_por, decrescente)
         
         if locais:
-            # Converter para DataFrame
-            df_locais = pd.DataFrame(locais)
-            
-            # Expandir coordenadas
-            if 'coordenadas' in df_locais.columns:
-                df_coords = pd.json_normalize(df_locais['coordenadas'])
-                df_coords.columns = ['latitude', 'longitude']
-                df_locais = pd.concat([df_locais.drop('coordenadas', axis=1), df_coords], axis=1)
+            df_locais = tabela_locais(locais)
             
             st.dataframe(df_locais, use_container_width=True)
+            
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                if st.button("⬅️ Anterior", disabled=len(cursores) == 1, key="anterior_locais"):
+                    cursores.pop()
+                    st.rerun()
+            with col2:
+                if st.button("Próxima ➡️", disabled=proximo is None, key="proxima_locais"):
+                    cursores.append(proximo)
+                    st.rerun()
+            with col3:
+                st.caption(f"Página {len(cursores)}")
         else:
             st.info("Nenhum local cadastrado. Use a aba 'Adicionar Local' ou 'Dados de Exemplo'.")
     
@@ -200,23 +347,83 @@ elif pagina == "📍 Gerenciar Locais (MongoDB)":
                 mongo_db.populate_sample_data()
             st.success("Dados de exemplo adicionados com sucesso!")
             st.rerun()
+    
+    with tab4:
+        st.subheader("Importar Locais em Lote")
+        st.markdown("""
+        Arquivo **JSONL** (um objeto por linha) ou **CSV** com as colunas
+        `nome_local`, `cidade`, `latitude`, `longitude` e, opcionalmente,
+        `descricao`, `categoria` e `endereco`.
+        """)
+        
+        arquivo = st.file_uploader("Arquivo", type=["jsonl", "csv"])
+        tamanho_lote = st.number_input("Tamanho do lote", min_value=100, max_value=50000, value=1000, step=100)
+        
+        if arquivo is not None and st.button("Importar", type="primary"):
+            barra = st.progress(0.0, text="Importando...")
+            total_bytes = max(arquivo.size, 1)
+            
+            def atualizar_progresso(inseridos, rejeitados):
+                barra.progress(min(arquivo.tell() / total_bytes, 1.0),
+                               text=f"{inseridos} inseridos, {rejeitados} rejeitados")
+            
+            resumo = mongo_db.importar_locais(arquivo, tamanho_lote=int(tamanho_lote),
+                                              progresso=atualizar_progresso)
+            barra.progress(1.0, text="Importação concluída")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Inseridos", resumo['inseridos'])
+            with col2:
+                st.metric("Rejeitados", resumo['rejeitados'])
+            
+            if resumo['amostra_rejeitados']:
+                st.write("**Linhas rejeitadas (primeiras 100):**")
+                st.dataframe(pd.DataFrame(resumo['amostra_rejeitados']), use_container_width=True)
+    
+    with tab5:
+        st.subheader("Buscar Locais por Texto")
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            termo = st.text_input("Termo de busca", placeholder="Ex: praia, museu histórico")
+        with col2:
+            limite_busca = st.number_input("Máx. resultados", min_value=1, max_value=200, value=20)
+        
+        if termo.strip():
+            resultados = mongo_db.search_locais(termo, limite=int(limite_busca), modo="texto")
+            
+            if resultados:
+                st.success(f"Encontrados {len(resultados)} locais (ordenados por relevância)")
+                
+                df_resultados = pd.DataFrame(resultados)
+                colunas = [c for c in ['nome_local', 'cidade', 'categoria', 'descricao', 'score']
+                           if c in df_resultados.columns]
+                st.dataframe(df_resultados[colunas], use_container_width=True)
+            else:
+                st.info("Nenhum local encontrado para o termo informado.")
 
 # Página de Consultas Integradas
 elif pagina == "🔍 Consultas Integradas":
     st.header("🔍 Consultas Integradas")
     st.markdown("Cruza dados do SQLite (cidades) com MongoDB (locais)")
     
-    # Selecionar cidade
-    cidades = sqlite_db.get_cidades()
-    if cidades:
-        cidade_selecionada = st.selectbox(
+    # Buscar e selecionar cidade (sem acentos/maiúsculas, por prefixo)
+    termo_cidade = st.text_input("Buscar cidade:", placeholder="Ex: joao pessoa, sao luis, rec")
+    cidades = sqlite_db.buscar_cidades(termo_cidade, limite=20) if termo_cidade.strip() else []
+    
+    if not termo_cidade.strip():
+        st.info("Digite o nome de uma cidade para começar.")
+    elif cidades:
+        cidade_info = st.selectbox(
             "Selecione uma cidade:",
-            options=[f"{c['nome']} - {c['uf']}" for c in cidades],
+            options=cidades,
+            format_func=lambda c: f"{c['nome']} - {c['uf']}",
             index=0
         )
         
-        if cidade_selecionada:
-            nome_cidade = cidade_selecionada.split(" - ")[0]
+        if cidade_info:
+            nome_cidade = cidade_info['nome']
             
             # Buscar locais da cidade no MongoDB
             locais_cidade = mongo_db.get_locais_by_cidade(nome_cidade)
@@ -225,9 +432,7 @@ elif pagina == "🔍 Consultas Integradas":
             
             with col1:
                 st.subheader(f"📊 Informações da Cidade")
-                cidade_info = next((c for c in cidades if c['nome'] == nome_cidade), None)
-                if cidade_info:
-                    st.json(cidade_info)
+                st.json(cidade_info)
             
             with col2:
                 st.subheader(f"📍 Locais em {nome_cidade}")
@@ -243,13 +448,14 @@ elif pagina == "🔍 Consultas Integradas":
                 else:
                     st.info(f"Nenhum local encontrado para {nome_cidade}")
     else:
-        st.warning("Nenhuma cidade cadastrada no SQLite.")
+        st.warning("Nenhuma cidade encontrada no SQLite para o termo informado.")
 
 # Página de Geoprocessamento
 elif pagina == "🌍 Geoprocessamento":
     st.header("🌍 Geoprocessamento")
     
-    tab1, tab2 = st.tabs(["📍 Busca por Proximidade", "📏 Calcular Distância"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📍 Busca por Proximidade", "🎯 Mais Próximos", "🔷 Busca por Região",
+                                            "📏 Calcular Distância", "🏙️ Cidades Próximas"])
     
     with tab1:
         st.subheader("Buscar Locais Próximos")
@@ -265,24 +471,24 @@ elif pagina == "🌍 Geoprocessamento":
         
         if st.button("Buscar Locais Próximos", type="primary"):
             if GeoProcessamento.validar_coordenadas(lat_central, lon_central):
-                # Buscar todos os locais
-                todos_locais = mongo_db.get_all_locais()
+                # Índice espacial construído uma vez e mantido pelo MongoDB
+                if mongo_db.indice_espacial is None:
+                    mongo_db.construir_indice_espacial()
+                indice = mongo_db.indice_espacial
                 
-                # Filtrar por proximidade
-                locais_proximos = GeoProcessamento.locais_proximos(
-                    todos_locais, lat_central, lon_central, raio_km
-                )
+                # Filtrar por proximidade apenas nas células vizinhas
+                contadores = {}
+                locais_proximos = indice.consultar_raio(lat_central, lon_central, raio_km,
+                                                        contadores=contadores)
                 
                 st.write(f"**{len(locais_proximos)} locais encontrados em um raio de {raio_km} km:**")
+                st.caption(
+                    f"Candidatos por camada — caixa delimitadora: {contadores['caixa_delimitadora']}, "
+                    f"haversine: {contadores['haversine']}, geodesic: {contadores['geodesic']}"
+                )
                 
                 if locais_proximos:
-                    df_proximos = pd.DataFrame(locais_proximos)
-                    
-                    # Expandir coordenadas
-                    if 'coordenadas' in df_proximos.columns:
-                        df_coords = pd.json_normalize(df_proximos['coordenadas'])
-                        df_coords.columns = ['latitude', 'longitude']
-                        df_proximos = pd.concat([df_proximos.drop('coordenadas', axis=1), df_coords], axis=1)
+                    df_proximos = tabela_locais(locais_proximos)
                     
                     st.dataframe(df_proximos, use_container_width=True)
                 else:
@@ -291,6 +497,60 @@ elif pagina == "🌍 Geoprocessamento":
                 st.error("Coordenadas inválidas!")
     
     with tab2:
+        st.subheader("Buscar os Locais Mais Próximos")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            lat_knn = st.number_input("Latitude", format="%.6f", value=-7.11532, key="lat_knn")
+            lon_knn = st.number_input("Longitude", format="%.6f", value=-34.861, key="lon_knn")
+        
+        with col2:
+            k = st.number_input("Quantidade de locais", min_value=1, max_value=100, value=5)
+            categoria_knn = st.selectbox("Categoria", ["Todas", "Ponto Turístico", "Praça", "Comércio", "Cultura", "Praia", "Outros"])
+        
+        if st.button("Buscar Mais Próximos", type="primary"):
+            if GeoProcessamento.validar_coordenadas(lat_knn, lon_knn):
+                if mongo_db.indice_espacial is None:
+                    mongo_db.construir_indice_espacial()
+                
+                mais_proximos = mongo_db.k_mais_proximos(
+                    lat_knn, lon_knn, int(k),
+                    None if categoria_knn == "Todas" else categoria_knn
+                )
+                
+                if mais_proximos:
+                    df_knn = tabela_locais(mais_proximos)
+                    
+                    st.dataframe(df_knn, use_container_width=True)
+                else:
+                    st.info("Nenhum local encontrado.")
+            else:
+                st.error("Coordenadas inválidas!")
+    
+    with tab3:
+        st.subheader("Buscar Locais Dentro de uma Região")
+        st.markdown("Informe um **Polygon** ou **MultiPolygon** GeoJSON (coordenadas em longitude, latitude).")
+        
+        poligono_padrao = {
+            "type": "Polygon",
+            "coordinates": [[[-34.95, -7.20], [-34.78, -7.20], [-34.78, -7.05], [-34.95, -7.05], [-34.95, -7.20]]]
+        }
+        poligono_texto = st.text_area("Polígono (GeoJSON)", value=json.dumps(poligono_padrao, indent=2), height=200)
+        
+        if st.button("Buscar na Região", type="primary"):
+            try:
+                locais_regiao = mongo_db.get_locais_em_poligono(json.loads(poligono_texto))
+                st.write(f"**{len(locais_regiao)} locais encontrados na região:**")
+                
+                if locais_regiao:
+                    df_regiao = tabela_locais(locais_regiao)
+                    
+                    st.dataframe(df_regiao, use_container_width=True)
+            except Exception as e:
+                st.error(f"Polígono inválido: {str(e)}")
+    
+    with tab4:
         st.subheader("Calcular Distância Entre Pontos")
         
         col1, col2 = st.columns(2)
@@ -320,15 +580,77 @@ elif pagina == "🌍 Geoprocessamento":
                     st.metric("Diferença", f"{abs(distancia - GeoProcessamento.distancia_haversine(lat_a, lon_a, lat_b, lon_b)):.4f} km")
             else:
                 st.error("Coordenadas inválidas!")
+    
+    with tab5:
+        st.subheader("Cidades Próximas a um Ponto (SQLite + R*Tree)")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            lat_cidade = st.number_input("Latitude", format="%.6f", value=-7.11532, key="lat_cidade")
+            lon_cidade = st.number_input("Longitude", format="%.6f", value=-34.861, key="lon_cidade")
+        
+        with col2:
+            raio_cidades = st.slider("Raio de busca (km)", 1, 500, 100, key="raio_cidades")
+        
+        if st.button("Buscar Cidades", type="primary"):
+            if GeoProcessamento.validar_coordenadas(lat_cidade, lon_cidade):
+                mais_proxima = sqlite_db.cidade_mais_proxima(lat_cidade, lon_cidade)
+                if mais_proxima:
+                    st.metric("Cidade mais próxima",
+                              f"{mais_proxima['nome']} - {mais_proxima['uf']}",
+                              f"{mais_proxima['distancia_km']:.2f} km", delta_color="off")
+                
+                cidades_raio = sqlite_db.cidades_no_raio(lat_cidade, lon_cidade, raio_cidades)
+                if cidades_raio:
+                    st.success(f"Encontradas {len(cidades_raio)} cidades em um raio de {raio_cidades} km")
+                    st.dataframe(pd.DataFrame(cidades_raio), use_container_width=True)
+                else:
+                    st.info("Nenhuma cidade com coordenadas encontrada no raio especificado.")
+            else:
+                st.error("Coordenadas inválidas!")
 
 # Página de Visualização no Mapa
 elif pagina == "🗺️ Visualização no Mapa":
     st.header("🗺️ Visualização no Mapa")
     
-    # Buscar todos os locais
-    locais = mongo_db.get_all_locais()
+    # Totais calculados no servidor; os locais um a um só são lidos no modo de marcadores
+    total_locais = mongo_db.contar_locais()
+    
+    with st.expander("🧩 Agrupamento de Locais (DBSCAN)"):
+        col1, col2 = st.columns(2)
+        with col1:
+            eps_km = st.number_input("Distância máxima entre vizinhos (km)", min_value=0.1, value=5.0)
+        with col2:
+            min_pontos = st.number_input("Mínimo de locais por núcleo", min_value=2, value=3)
+        
+        if st.button("Calcular Clusters", type="primary") and total_locais:
+            with st.spinner("Agrupando locais..."):
+                coordenadas = mongo_db.get_all_locais(formato="arrays", campos=["coordenadas"])
+                clusters = GeoProcessamento.dbscan_coordenadas(coordenadas['latitude'], coordenadas['longitude'],
+                                                               eps_km, int(min_pontos))
+                mongo_db.atualizar_clusters(coordenadas['_id'], clusters)
+                # Locais sem coordenadas ficam fora do DBSCAN: não manter um cluster antigo
+                mongo_db.limpar_clusters_sem_coordenadas()
+            # O resultado fica na sessão para ser exibido depois do rerun
+            st.session_state["clusters_dbscan"] = len(set(clusters.tolist()) - {-1})
+            st.rerun()
+        
+        if "clusters_dbscan" in st.session_state:
+            st.success(f"{st.session_state['clusters_dbscan']} clusters encontrados!")
+    
+    modo_mapa = st.radio("Modo de visualização", ["📍 Marcadores", "🔥 Mapa de Calor", "🟦 Grade"],
+                         horizontal=True)
+    if modo_mapa != "📍 Marcadores":
+        zoom_grade = st.slider("Nível de detalhe da grade (zoom)", 3, 14, 7)
+        tamanho_celula = GeoProcessamento.tamanho_celula_por_zoom(zoom_grade)
+    
+    colorir_por_cluster = st.checkbox("Colorir marcadores por cluster")
+    cores_cluster = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'cadetblue',
+                     'darkgreen', 'darkblue', 'pink', 'lightred', 'darkpurple', 'lightblue',
+                     'lightgreen', 'beige', 'black']
     
-    if locais:
+    if total_locais:
         # Criar mapa centrado no Nordeste
         mapa = folium.Map(
             location=[-7.5, -37.0],  # Centro do Nordeste
@@ -336,31 +658,68 @@ elif pagina == "🗺️ Visualização no Mapa":
             tiles='OpenStreetMap'
         )
         
-        # Adicionar marcadores para cada local
-        for local in locais:
-            coords = local.get('coordenadas', {})
-            if coords:
-                lat = coords.get('latitude')
-                lon = coords.get('longitude')
+        if modo_mapa == "🔥 Mapa de Calor":
+            # Apenas os agregados por célula vão para o navegador
+            celulas = mongo_db.agregar_grade(tamanho_celula)
+            HeatMap(
+                [[c['latitude'], c['longitude'], c['quantidade']] for c in celulas],
+                radius=15
+            ).add_to(mapa)
+        
+        elif modo_mapa == "🟦 Grade":
+            celulas = mongo_db.agregar_grade(tamanho_celula)
+            maximo = max((c['quantidade'] for c in celulas), default=1)
+            cores_grade = ['#ffffb2', '#fecc5c', '#fd8d3c', '#f03b20', '#bd0026']
+            
+            for celula in celulas:
+                cor = cores_grade[min(int(celula['quantidade'] / maximo * len(cores_grade)), len(cores_grade) - 1)]
+                folium.Rectangle(
+                    bounds=[[celula['lat_min'], celula['lon_min']], [celula['lat_max'], celula['lon_max']]],
+                    color=cor,
+                    fill=True,
+                    fill_color=cor,
+                    fill_opacity=0.6,
+                    tooltip=f"{celula['quantidade']} locais"
+                ).add_to(mapa)
+        
+        else:
+            # Buscar apenas os campos usados nos marcadores, já em colunas (latitude/longitude achatadas)
+            df_locais = mongo_db.get_all_locais(
+                formato="dataframe",
+                campos=["nome_local", "cidade", "categoria", "descricao", "coordenadas", "cluster"]
+            )
+            
+            # Adicionar marcadores para cada local com coordenadas
+            df_marcadores = df_locais.dropna(subset=['latitude', 'longitude']).fillna(
+                {'nome_local': 'N/A', 'cidade': 'N/A', 'categoria': 'N/A', 'descricao': 'N/A'}
+            )
+            for local in df_marcadores.itertuples(index=False):
+                lat = local.latitude
+                lon = local.longitude
+                cluster = -1 if pd.isna(local.cluster) else int(local.cluster)
                 
-                if lat and lon:
-                    # Criar popup com informações do local
-                    popup_html = f"""
-                    <div style="width: 200px;">
-                        <h4>{local.get('nome_local', 'N/A')}</h4>
-                        <p><strong>Cidade:</strong> {local.get('cidade', 'N/A')}</p>
-                        <p><strong>Categoria:</strong> {local.get('categoria', 'N/A')}</p>
-                        <p><strong>Descrição:</strong> {local.get('descricao', 'N/A')}</p>
-                        <p><strong>Coordenadas:</strong> {lat:.6f}, {lon:.6f}</p>
-                    </div>
-                    """
-                    
-                    folium.Marker(
-                        [lat, lon],
-                        popup=folium.Popup(popup_html, max_width=300),
-                        tooltip=local.get('nome_local', 'N/A'),
-                        icon=folium.Icon(color='blue', icon='info-sign')
-                    ).add_to(mapa)
+                # Criar popup com informações do local
+                popup_html = f"""
+                <div style="width: 200px;">
+                    <h4>{local.nome_local}</h4>
+                    <p><strong>Cidade:</strong> {local.cidade}</p>
+                    <p><strong>Categoria:</strong> {local.categoria}</p>
+                    <p><strong>Descrição:</strong> {local.descricao}</p>
+                    <p><strong>Coordenadas:</strong> {lat:.6f}, {lon:.6f}</p>
+                    <p><strong>Cluster:</strong> {cluster if cluster >= 0 else 'N/A'}</p>
+                </div>
+                """
+                
+                cor = 'blue'
+                if colorir_por_cluster:
+                    cor = 'gray' if cluster < 0 else cores_cluster[cluster % len(cores_cluster)]
+                
+                folium.Marker(
+                    [lat, lon],
+                    popup=folium.Popup(popup_html, max_width=300),
+                    tooltip=local.nome_local,
+                    icon=folium.Icon(color=cor, icon='info-sign')
+                ).add_to(mapa)
         
         # Exibir mapa
         st_folium(mapa, width=700, height=500)
@@ -368,13 +727,11 @@ elif pagina == "🗺️ Visualização no Mapa":
         # Estatísticas do mapa
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total de Locais", len(locais))
+            st.metric("Total de Locais", total_locais)
         with col2:
-            cidades_unicas = len(set(local.get('cidade', '') for local in locais))
-            st.metric("Cidades", cidades_unicas)
+            st.metric("Cidades", len(mongo_db.contar_por_campo("cidade")))
         with col3:
-            categorias_unicas = len(set(local.get('categoria', '') for local in locais))
-            st.metric("Categorias", categorias_unicas)
+            st.metric("Categorias", len(mongo_db.contar_por_campo("categoria")))
     
     else:
         st.info("Nenhum local cadastrado para visualizar no mapa.")
@@ -387,57 +744,56 @@ elif pagina == "📊 Estatísticas":
     
     with col1:
         st.subheader("📊 SQLite - Cidades")
-        cidades = sqlite_db.get_cidades()
-        estados = sqlite_db.get_estados()
+        # Uma linha por estado, mantida pelos gatilhos da tabela cidades
+        resumo_estados = sqlite_db.get_resumo_estados()
         
-        if cidades:
-            df_cidades = pd.DataFrame(cidades)
+        if resumo_estados:
+            df_resumo = pd.DataFrame(resumo_estados).set_index('uf')
             
             # Estatísticas por estado
-            stats_estado = df_cidades.groupby('uf').size().reset_index(name='quantidade')
             st.write("**Cidades por Estado:**")
-            st.bar_chart(stats_estado.set_index('uf'))
+            st.bar_chart(df_resumo[['quantidade_cidades']].rename(columns={'quantidade_cidades': 'quantidade'}))
             
             # População total
-            pop_total = df_cidades['populacao'].sum()
+            pop_total = int(df_resumo['populacao_total'].sum())
             st.metric("População Total", f"{pop_total:,}")
+            
+            st.write("**Densidade Demográfica (hab/km²):**")
+            st.bar_chart(df_resumo['densidade'].dropna())
     
     with col2:
         st.subheader("🗃️ MongoDB - Locais")
-        locais = mongo_db.get_all_locais()
+        # As três agregações rodam ao mesmo tempo no servidor
+        stats_categoria, stats_cidade, stats_geo = executor_async.executar_concorrente(
+            mongo_async.contar_por_campo("categoria"),
+            mongo_async.contar_por_campo("cidade", limite=10),
+            mongo_async.estatisticas_coordenadas()
+        )
         
-        if locais:
-            df_locais = pd.DataFrame(locais)
-            
-            # Estatísticas por categoria
-            if 'categoria' in df_locais.columns:
-                stats_categoria = df_locais['categoria'].value_counts()
-                st.write("**Locais por Categoria:**")
-                st.bar_chart(stats_categoria)
-            
-            # Estatísticas por cidade
-            if 'cidade' in df_locais.columns:
-                stats_cidade = df_locais['cidade'].value_counts().head(10)
-                st.write("**Top 10 Cidades:**")
-                st.bar_chart(stats_cidade)
+        # Estatísticas por categoria
+        if stats_categoria:
+            st.write("**Locais por Categoria:**")
+            st.bar_chart(pd.DataFrame(stats_categoria).set_index('categoria'))
+        
+        # Estatísticas por cidade
+        if stats_cidade:
+            st.write("**Top 10 Cidades:**")
+            st.bar_chart(pd.DataFrame(stats_cidade).set_index('cidade'))
     
     # Estatísticas geográficas
-    if locais:
+    if stats_geo:
         st.subheader("🌍 Estatísticas Geográficas")
-        stats_geo = GeoProcessamento.estatisticas_geograficas(locais)
+        col1, col2, col3, col4 = st.columns(4)
         
-        if stats_geo:
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total de Locais", stats_geo['total_locais'])
-            with col2:
-                st.metric("Latitude Média", f"{stats_geo['latitude_media']:.4f}")
-            with col3:
-                st.metric("Longitude Média", f"{stats_geo['longitude_media']:.4f}")
-            with col4:
-                centroide = stats_geo['centroide']
-                st.metric("Centroide", f"{centroide[0]:.4f}, {centroide[1]:.4f}")
+        with col1:
+            st.metric("Total de Locais", stats_geo['total_locais'])
+        with col2:
+            st.metric("Latitude Média", f"{stats_geo['latitude_media']:.4f}")
+        with col3:
+            st.metric("Longitude Média", f"{stats_geo['longitude_media']:.4f}")
+        with col4:
+            centroide = stats_geo['centroide']
+            st.metric("Centroide", f"{centroide[0]:.4f}, {centroide[1]:.4f}")
 
 # Rodapé
 st.markdown("---")
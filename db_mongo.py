@@ -1,75 +1,585 @@
-from pymongo import MongoClient
-from typing import List, Dict, Any, Optional
+from pymongo import MongoClient, ASCENDING, DESCENDING, GEOSPHERE, TEXT, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable, Union, IO, Callable
+import contextlib
+import csv
+import io
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
-class MongoDB:
-    def __init__(self, connection_string: str = None, db_name: str = "geolocalizacao"):
-        # Usar string de conexão do ambiente ou padrão
-        if connection_string is None:
-            connection_string = os.getenv('MONGODB_CONNECTION_STRING', 'mongodb://localhost:27017/')
-        self.client = MongoClient(connection_string)
-        self.db = self.client[db_name]
-        self.collection = self.db.locais
+import numpy as np
+import pandas as pd
+
+from geoprocessamento import GeoProcessamento, IndiceEspacial, normalizar_texto
+
+
+class ConsultasLocais:
+    """
+    Constantes e montagem de documentos, filtros e pipelines da coleção de locais
     
-    def insert_local(self, nome_local: str, cidade: str, latitude: float, longitude: float, 
-                    descricao: str = "", categoria: str = "", endereco: str = "") -> str:
-        """Insere um novo local no MongoDB"""
-        documento = {
+    Base comum de MongoDB (PyMongo) e MongoDBAsync (Motor): aqui só se monta o que
+    vai para o servidor e se converte o que volta dele; a E/S fica em cada subclasse.
+    """
+    
+    # Campos aceitos como ordenação na paginação por chave
+    ORDENACOES_PAGINACAO = ("_id", "nome_local", "cidade", "data_cadastro")
+    
+    # Campos de busca exata guardados também na forma normalizada
+    CAMPOS_NORMALIZADOS = ("cidade", "categoria")
+    
+    # Modos aceitos por search_locais
+    MODOS_BUSCA = ("texto", "regex")
+    
+    # Formatos de retorno das leituras em lote (ver consultar_colunar)
+    FORMATOS = ("registros", "dataframe", "arrays")
+    
+    # Campos lidos por padrão no modo colunar ("coordenadas" vira latitude/longitude)
+    CAMPOS_COLUNARES = ("nome_local", "cidade", "categoria", "descricao", "endereco", "coordenadas")
+    
+    # Campos aceitos por contar_por_campo
+    CAMPOS_CONTAGEM = ("categoria", "cidade")
+    
+    # Locais com coordenadas numéricas: os únicos do formato "arrays" (e do DBSCAN)
+    COM_COORDENADAS = {"coordenadas.latitude": {"$type": "number"},
+                       "coordenadas.longitude": {"$type": "number"}}
+    
+    @staticmethod
+    def _em_lotes(itens: Iterable[Any], tamanho_lote: int) -> Iterator[List[Any]]:
+        """Agrupa os itens em listas de até `tamanho_lote`, sem materializar o iterável inteiro"""
+        lote = []
+        for item in itens:
+            lote.append(item)
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+        
+        if lote:
+            yield lote
+    
+    @classmethod
+    def _campos_normalizados(cls, dados: Dict[str, Any], todos: bool = False) -> Dict[str, str]:
+        """Calcula as versões normalizadas dos campos de busca presentes em `dados` (ou de todos)"""
+        return {
+            f"{campo}_norm": normalizar_texto(dados.get(campo) or "")
+            for campo in cls.CAMPOS_NORMALIZADOS
+            if todos or campo in dados
+        }
+    
+    @staticmethod
+    def _ponto_geojson(latitude: float, longitude: float) -> Dict[str, Any]:
+        """Monta um ponto GeoJSON (a ordem no GeoJSON é longitude, latitude)"""
+        return {"type": "Point", "coordinates": [longitude, latitude]}
+    
+    @classmethod
+    def _montar_documento(cls, nome_local: str, cidade: str, latitude: float, longitude: float,
+                          descricao: str = "", categoria: str = "", endereco: str = "") -> Dict[str, Any]:
+        """Monta o documento de um local com todos os campos derivados"""
+        return {
             "nome_local": nome_local,
             "cidade": cidade,
             "coordenadas": {
                 "latitude": latitude,
                 "longitude": longitude
             },
+            "location": cls._ponto_geojson(latitude, longitude),
+            "geohash": GeoProcessamento.geohash_codificar(latitude, longitude),
             "descricao": descricao,
             "categoria": categoria,
+            "cidade_norm": normalizar_texto(cidade),
+            "categoria_norm": normalizar_texto(categoria),
             "endereco": endereco,
             "data_cadastro": datetime.now(),
             "ativo": True
         }
+    
+    @classmethod
+    def _preparar_atualizacao(cls, dados_atualizacao: Dict[str, Any]) -> Dict[str, Any]:
+        """Tira os campos fixos e recalcula os derivados (location, geohash, *_norm) de uma atualização"""
+        # Remover campos que não devem ser atualizados
+        dados_atualizacao.pop('_id', None)
+        dados_atualizacao.pop('data_cadastro', None)
         
-        resultado = self.collection.insert_one(documento)
-        return str(resultado.inserted_id)
+        # Manter o ponto GeoJSON e o geohash em sincronia com as coordenadas
+        coordenadas = dados_atualizacao.get('coordenadas')
+        if coordenadas:
+            dados_atualizacao['location'] = cls._ponto_geojson(
+                coordenadas['latitude'], coordenadas['longitude']
+            )
+            dados_atualizacao['geohash'] = GeoProcessamento.geohash_codificar(
+                coordenadas['latitude'], coordenadas['longitude']
+            )
+        
+        # Manter as versões normalizadas de cidade/categoria em sincronia
+        dados_atualizacao.update(cls._campos_normalizados(dados_atualizacao))
+        return dados_atualizacao
     
-    def get_locais_by_cidade(self, cidade: str) -> List[Dict[str, Any]]:
-        """Retorna todos os locais de uma cidade específica"""
+    @staticmethod
+    def _atualizacao_remocao() -> Dict[str, Any]:
+        """Atualização do soft delete (o data_remocao é usado depois pelo arquivamento)"""
+        return {"$set": {"ativo": False, "data_remocao": datetime.now()}}
+    
+    @staticmethod
+    def _atualizacao_restauracao() -> Dict[str, Any]:
+        """Atualização que desfaz o soft delete"""
+        return {"$set": {"ativo": True}, "$unset": {"data_remocao": ""}}
+    
+    @staticmethod
+    def _filtros_compactacao(agora: datetime, idade_minima_dias: float) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Filtros de compactar_locais: removidos sem data_remocao e removidos antes do limite"""
+        limite = agora - timedelta(days=idade_minima_dias)
+        return ({"ativo": False, "data_remocao": {"$exists": False}},
+                {"ativo": False, "data_remocao": {"$lt": limite}})
+    
+    @staticmethod
+    def _preparar_movidos(documentos: List[Dict[str, Any]], marcar_campos: Optional[Dict[str, Any]],
+                          remover_campos: Tuple[str, ...]) -> List[ReplaceOne]:
+        """Ajusta os campos dos documentos movidos e monta as substituições no destino"""
+        for documento in documentos:
+            documento.update(marcar_campos or {})
+            for campo in remover_campos:
+                documento.pop(campo, None)
+        
+        # Substituir com upsert deixa o passo repetível se uma execução anterior parou no meio
+        return [ReplaceOne({"_id": documento['_id']}, documento, upsert=True) for documento in documentos]
+    
+    @staticmethod
+    def _consulta_ativos(filtro: Optional[Dict[str, Any]] = None, campos: Optional[List[str]] = None
+                         ) -> Tuple[Dict[str, Any], Optional[Dict[str, int]]]:
+        """Monta a consulta (só locais ativos) e a projeção de iter_locais"""
+        consulta = {"ativo": True}
+        consulta.update(filtro or {})
+        projecao = {campo: 1 for campo in campos} if campos else None
+        return consulta, projecao
+    
+    @classmethod
+    def _filtro_raio(cls, latitude: float, longitude: float, raio_km: Optional[float] = None) -> Dict[str, Any]:
+        """Filtro $nearSphere (ordenado por distância), limitado ao raio se informado"""
+        proximidade = {"$geometry": cls._ponto_geojson(latitude, longitude)}
+        if raio_km is not None:
+            proximidade["$maxDistance"] = raio_km * 1000
+        return {"location": {"$nearSphere": proximidade}}
+    
+    @staticmethod
+    def _filtro_geohash(latitude: float, longitude: float, raio_km: float) -> Dict[str, Any]:
+        """Filtro com as faixas de geohash que cobrem o círculo"""
+        intervalos = GeoProcessamento.geohash_intervalos(latitude, longitude, raio_km)
+        return {"$or": [{"geohash": {"$gte": inicio, "$lt": fim}} for inicio, fim in intervalos]}
+    
+    @staticmethod
+    def _filtro_poligono(poligono: Dict[str, Any]) -> Dict[str, Any]:
+        """Filtro $geoWithin para um Polygon/MultiPolygon GeoJSON (aceita também uma Feature)"""
+        if poligono.get('type') == 'Feature':
+            poligono = poligono['geometry']
+        
+        return {"location": {"$geoWithin": {"$geometry": poligono}}}
+    
+    @classmethod
+    def _filtro_k_proximos(cls, latitude: float, longitude: float, categoria: str = None) -> Dict[str, Any]:
+        """Filtro de k_mais_proximos sem o índice espacial em memória"""
+        filtro = cls._filtro_raio(latitude, longitude)
+        if categoria:
+            filtro["categoria_norm"] = normalizar_texto(categoria)
+        return filtro
+    
+    @classmethod
+    def _consulta_busca(cls, termo: str, modo: str
+                        ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[List[Tuple[str, Any]]]]:
+        """Monta a consulta, a projeção e a ordenação de search_locais"""
+        if modo not in cls.MODOS_BUSCA:
+            raise ValueError(f"Modo de busca não suportado: {modo}")
+        
+        if modo == "regex":
+            consulta, _ = cls._consulta_ativos({
+                "$or": [
+                    {"nome_local": {"$regex": termo, "$options": "i"}},
+                    {"descricao": {"$regex": termo, "$options": "i"}},
+                    {"categoria": {"$regex": termo, "$options": "i"}}
+                ]
+            })
+            return consulta, None, None
+        
+        relevancia = {"$meta": "textScore"}
+        return ({"$text": {"$search": termo, "$language": "portuguese"}, "ativo": True},
+                {"score": relevancia}, [("score", relevancia)])
+    
+    @classmethod
+    def _pipeline_colunar(cls, filtro: Optional[Dict[str, Any]], campos: Optional[List[str]],
+                          formato: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Monta o pipeline do modo colunar e a lista de colunas resultante"""
+        if formato not in cls.FORMATOS[1:]:
+            raise ValueError(f"Formato colunar não suportado: {formato}")
+        
+        consulta, _ = cls._consulta_ativos(filtro)
+        
+        campos = list(cls.CAMPOS_COLUNARES if campos is None else campos)
+        if formato == "arrays":
+            # Arrays de float não têm lugar para coordenada ausente
+            consulta.update(cls.COM_COORDENADAS)
+            if "coordenadas" not in campos:
+                campos.append("coordenadas")
+        
+        projecao = {"_id": {"$toString": "$_id"}}
+        for campo in campos:
+            if campo == "coordenadas":
+                projecao["latitude"] = "$coordenadas.latitude"
+                projecao["longitude"] = "$coordenadas.longitude"
+            elif campo != "_id":
+                projecao[campo] = f"${campo}"
+        
+        return [{"$match": consulta}, {"$project": projecao}], list(projecao)
+    
+    @staticmethod
+    def _montar_colunar(documentos: Iterable[Dict[str, Any]], colunas: List[str],
+                        formato: str) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+        """Converte os documentos achatados em DataFrame ou em arrays por coluna"""
+        documentos = list(documentos)
+        if formato == "dataframe":
+            return pd.DataFrame(documentos, columns=colunas)
+        
+        arrays = {}
+        for coluna in colunas:
+            if coluna in ("latitude", "longitude"):
+                arrays[coluna] = np.fromiter((documento[coluna] for documento in documentos),
+                                             dtype=float, count=len(documentos))
+            else:
+                arrays[coluna] = np.array([documento.get(coluna) for documento in documentos], dtype=object)
+        return arrays
+    
+    @classmethod
+    def _consulta_pagina(cls, apos: Optional[Tuple[Any, str]], ordenar_por: str,
+                         decrescente: bool) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """Monta o filtro e a ordenação de uma página a partir do cursor da página anterior"""
+        from bson import ObjectId
+        
+        if ordenar_por not in cls.ORDENACOES_PAGINACAO:
+            raise ValueError(f"Ordenação não suportada: {ordenar_por}")
+        
+        direcao = DESCENDING if decrescente else ASCENDING
+        operador = "$lt" if decrescente else "$gt"
+        
+        filtro = {}
+        if apos is not None:
+            valor, ultimo_id = apos
+            ultimo_id = ObjectId(ultimo_id)
+            if ordenar_por == "_id":
+                filtro = {"_id": {operador: ultimo_id}}
+            else:
+                # Continua depois do último (valor, _id) visto, desempatando pelo _id
+                filtro = {"$or": [
+                    {ordenar_por: {operador: valor}},
+                    {ordenar_por: valor, "_id": {operador: ultimo_id}}
+                ]}
+        
+        ordenacao = [(ordenar_por, direcao)]
+        if ordenar_por != "_id":
+            ordenacao.append(("_id", direcao))
+        
+        consulta, _ = cls._consulta_ativos(filtro)
+        return consulta, ordenacao
+    
+    @staticmethod
+    def _fechar_pagina(locais: List[Dict[str, Any]], tamanho: int, ordenar_por: str
+                       ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
+        """Corta o documento extra da página e calcula o cursor da próxima"""
+        proximo = None
+        if len(locais) > tamanho:
+            locais = locais[:tamanho]
+            ultimo = locais[-1]
+            proximo = (ultimo.get(ordenar_por) if ordenar_por != "_id" else ultimo['_id'], ultimo['_id'])
+        
+        return locais, proximo
+    
+    @staticmethod
+    def _pipeline_grade(tamanho_celula: float,
+                        caixa: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str, Any]]:
+        """Monta o pipeline de agregação por células da grade"""
+        filtro = {"ativo": True, "coordenadas.latitude": {"$exists": True}}
+        if caixa is not None:
+            lat_min, lat_max, lon_min, lon_max = caixa
+            filtro["coordenadas.latitude"] = {"$gte": lat_min, "$lte": lat_max}
+            filtro["coordenadas.longitude"] = {"$gte": lon_min, "$lte": lon_max}
+        
+        return [
+            {"$match": filtro},
+            {"$group": {
+                "_id": {
+                    "linha": {"$floor": {"$divide": ["$coordenadas.latitude", tamanho_celula]}},
+                    "coluna": {"$floor": {"$divide": ["$coordenadas.longitude", tamanho_celula]}}
+                },
+                "quantidade": {"$sum": 1},
+                "latitude": {"$avg": "$coordenadas.latitude"},
+                "longitude": {"$avg": "$coordenadas.longitude"}
+            }}
+        ]
+    
+    @staticmethod
+    def _celula_agregada(celula: Dict[str, Any], tamanho_celula: float) -> Dict[str, Any]:
+        """Converte um grupo do pipeline da grade no formato de GeoProcessamento.agregar_grade"""
+        return GeoProcessamento._celula_grade(int(celula['_id']['linha']), int(celula['_id']['coluna']),
+                                              tamanho_celula, celula['quantidade'],
+                                              celula['latitude'], celula['longitude'])
+    
+    @classmethod
+    def _pipeline_contagem(cls, campo: str, limite: int = 0) -> List[Dict[str, Any]]:
+        """Monta o pipeline de contagem por campo, com o top-N opcional"""
+        if campo not in cls.CAMPOS_CONTAGEM:
+            raise ValueError(f"Campo de contagem não suportado: {campo}")
+        
+        pipeline = [
+            {"$match": {"ativo": True, campo: {"$ne": None}}},
+            {"$group": {"_id": f"${campo}", "quantidade": {"$sum": 1}}},
+            {"$sort": {"quantidade": DESCENDING, "_id": ASCENDING}}
+        ]
+        if limite:
+            pipeline.append({"$limit": limite})
+        pipeline.append({"$project": {"_id": 0, campo: "$_id", "quantidade": 1}})
+        
+        return pipeline
+    
+    @staticmethod
+    def _pipeline_estatisticas() -> List[Dict[str, Any]]:
+        """Monta o pipeline com contagem, mínimo, máximo, média e desvio padrão das coordenadas"""
+        com_coordenadas = {"$and": [{"$isNumber": "$coordenadas.latitude"},
+                                    {"$isNumber": "$coordenadas.longitude"}]}
+        
+        def so_com_coordenadas(eixo: str) -> Dict[str, Any]:
+            return {"$cond": [com_coordenadas, f"$coordenadas.{eixo}", None]}
+        
+        grupo = {"_id": None, "total_locais": {"$sum": 1},
+                 "locais_com_coordenadas": {"$sum": {"$cond": [com_coordenadas, 1, 0]}}}
+        for eixo in ("latitude", "longitude"):
+            valor = so_com_coordenadas(eixo)
+            grupo[f"{eixo}_media"] = {"$avg": valor}
+            grupo[f"{eixo}_min"] = {"$min": valor}
+            grupo[f"{eixo}_max"] = {"$max": valor}
+            grupo[f"{eixo}_desvio_padrao"] = {"$stdDevPop": valor}
+        
+        return [{"$match": {"ativo": True}}, {"$group": grupo}]
+    
+    @staticmethod
+    def _resultado_estatisticas(grupos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Converte o grupo único do pipeline no dicionário de estatísticas (vazio sem coordenadas)"""
+        if not grupos or not grupos[0]['locais_com_coordenadas']:
+            return {}
+        
+        estatisticas = grupos[0]
+        estatisticas.pop('_id')
+        estatisticas['centroide'] = (estatisticas['latitude_media'], estatisticas['longitude_media'])
+        return estatisticas
+
+
+class MongoDB(ConsultasLocais):
+    # Índices esperados na coleção: (nome, chaves, opções)
+    INDICES = [
+        ("location_2dsphere", [("location", GEOSPHERE)], {}),
+        ("geohash", [("geohash", ASCENDING)], {}),
+        # Índices (campo, _id) para a paginação por chave
+        ("nome_local_id", [("nome_local", ASCENDING), ("_id", ASCENDING)], {}),
+        ("cidade_id", [("cidade", ASCENDING), ("_id", ASCENDING)], {}),
+        ("data_cadastro_id", [("data_cadastro", ASCENDING), ("_id", ASCENDING)], {}),
+        # Buscas exatas nos campos normalizados, só sobre os locais ativos
+        ("cidade_norm_categoria_norm_ativos",
+         [("cidade_norm", ASCENDING), ("categoria_norm", ASCENDING)],
+         {"partialFilterExpression": {"ativo": True}}),
+        ("categoria_norm_ativos", [("categoria_norm", ASCENDING)],
+         {"partialFilterExpression": {"ativo": True}}),
+        # Busca textual ponderada (stemming em português, sem acentos/maiúsculas)
+        ("locais_texto",
+         [("nome_local", TEXT), ("categoria", TEXT), ("descricao", TEXT)],
+         {"weights": {"nome_local": 10, "categoria": 5, "descricao": 1},
+          "default_language": "portuguese"}),
+        # Seleção dos locais removidos para o arquivamento
+        ("inativos_data_remocao", [("data_remocao", ASCENDING)],
+         {"partialFilterExpression": {"ativo": False}}),
+    ]
+    
+    def __init__(self, connection_string: str = None, db_name: str = "geolocalizacao"):
+        # Usar string de conexão do ambiente ou padrão
+        if connection_string is None:
+            connection_string = os.getenv('MONGODB_CONNECTION_STRING', 'mongodb://localhost:27017/')
+        self.client = MongoClient(connection_string)
+        self.db = self.client[db_name]
+        self.collection = self.db.locais
+        # Locais removidos há tempo suficiente saem da coleção principal para cá
+        self.arquivo = self.db.locais_arquivo
+        # Índice espacial em memória, construído sob demanda
+        self.indice_espacial: Optional[IndiceEspacial] = None
+        
+        self.migrar_localizacao_geojson()
+        self.migrar_geohash()
+        self.migrar_campos_normalizados()
+        self.criar_indices()
+    
+    def criar_indices(self):
+        """Cria os índices usados pelas consultas (operação idempotente)"""
+        for nome, chaves, opcoes in self.INDICES:
+            self.collection.create_index(chaves, name=nome, **opcoes)
+        
+        faltando = self.verificar_indices()
+        if faltando:
+            raise RuntimeError(f"Índices não encontrados no MongoDB: {', '.join(faltando)}")
+    
+    def verificar_indices(self) -> List[str]:
+        """Retorna os nomes dos índices esperados que não existem na coleção"""
+        existentes = self.collection.index_information()
+        return [nome for nome, _, _ in self.INDICES if nome not in existentes]
+    
+    def _executar_em_lotes(self, operacoes: Iterable[UpdateOne], tamanho_lote: int = 1000) -> int:
+        """Envia operações de escrita em lotes de bulk_write não ordenados"""
+        return sum(self.collection.bulk_write(lote, ordered=False).modified_count
+                   for lote in self._em_lotes(operacoes, tamanho_lote))
+    
+    def migrar_localizacao_geojson(self) -> int:
+        """Adiciona o ponto GeoJSON 'location' aos documentos que ainda não o possuem"""
+        resultado = self.collection.update_many(
+            {"location": {"$exists": False}, "coordenadas.latitude": {"$exists": True}},
+            [{"$set": {"location": {
+                "type": "Point",
+                "coordinates": ["$coordenadas.longitude", "$coordenadas.latitude"]
+            }}}]
+        )
+        return resultado.modified_count
+    
+    def migrar_geohash(self, tamanho_lote: int = 1000) -> int:
+        """Calcula o campo 'geohash' dos documentos que ainda não o possuem"""
         locais = self.collection.find(
-            {"cidade": {"$regex": cidade, "$options": "i"}, "ativo": True}
+            {"geohash": {"$exists": False}, "coordenadas.latitude": {"$exists": True}},
+            {"coordenadas": 1}
         )
         
-        resultado = []
-        for local in locais:
-            local['_id'] = str(local['_id'])  # Converter ObjectId para string
-            resultado.append(local)
+        return self._executar_em_lotes((
+            UpdateOne({"_id": local['_id']}, {"$set": {"geohash": GeoProcessamento.geohash_codificar(
+                local['coordenadas']['latitude'], local['coordenadas']['longitude']
+            )}})
+            for local in locais
+        ), tamanho_lote)
+    
+    def migrar_campos_normalizados(self, tamanho_lote: int = 1000) -> int:
+        """Preenche cidade_norm/categoria_norm nos documentos que ainda não os possuem"""
+        locais = self.collection.find(
+            {"$or": [{f"{campo}_norm": {"$exists": False}} for campo in self.CAMPOS_NORMALIZADOS]},
+            {campo: 1 for campo in self.CAMPOS_NORMALIZADOS}
+        )
+        
+        # Grava sempre os dois campos (vazios se o original faltar), senão o
+        # documento voltaria a casar com o filtro a cada inicialização
+        return self._executar_em_lotes((
+            UpdateOne({"_id": local['_id']}, {"$set": self._campos_normalizados(local, todos=True)})
+            for local in locais
+        ), tamanho_lote)
+    
+    def insert_local(self, nome_local: str, cidade: str, latitude: float, longitude: float, 
+                    descricao: str = "", categoria: str = "", endereco: str = "") -> str:
+        """Insere um novo local no MongoDB"""
+        documento = self._montar_documento(nome_local, cidade, latitude, longitude,
+                                           descricao, categoria, endereco)
+        
+        resultado = self.collection.insert_one(documento)
+        
+        if self.indice_espacial is not None:
+            documento['_id'] = str(resultado.inserted_id)
+            self.indice_espacial.inserir(documento)
+        
+        return str(resultado.inserted_id)
+    
+    def _inserir_lote(self, documentos: List[Dict[str, Any]]) -> Tuple[int, Dict[int, str]]:
+        """Insere um lote com insert_many não ordenado; retorna (inseridos, {posição: erro})"""
+        erros = {}
+        try:
+            self.collection.insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            erros = {erro['index']: erro.get('errmsg', 'erro de escrita')
+                     for erro in e.details.get('writeErrors', [])}
         
-        return resultado
+        if self.indice_espacial is not None:
+            for posicao, documento in enumerate(documentos):
+                if posicao not in erros:
+                    self.indice_espacial.inserir({**documento, '_id': str(documento['_id'])})
+        
+        return len(documentos) - len(erros), erros
+    
+    def get_locais_by_cidade(self, cidade: str, formato: str = "registros"
+                             ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
+        """Retorna todos os locais de uma cidade específica"""
+        return self._ler({"cidade_norm": normalizar_texto(cidade)}, formato)
     
     def get_locais_by_coordenadas(self, latitude: float, longitude: float, 
                                  raio_km: float = 10) -> List[Dict[str, Any]]:
-        """Retorna locais próximos a uma coordenada específica"""
-        # Usar operador $geoWithin para buscar em um raio específico
-        # Para simplificar, vamos buscar todos e filtrar depois no geoprocessamento
-        locais = self.collection.find({"ativo": True})
+        """Retorna locais dentro do raio, já ordenados por distância (índice 2dsphere)"""
+        return list(self.iter_locais(self._filtro_raio(latitude, longitude, raio_km)))
+    
+    def get_locais_por_geohash(self, latitude: float, longitude: float,
+                               raio_km: float = 10) -> List[Dict[str, Any]]:
+        """Busca por raio com varreduras de faixa no índice de geohash, já com distância calculada"""
+        locais = list(self.iter_locais(self._filtro_geohash(latitude, longitude, raio_km)))
         
-        resultado = []
-        for local in locais:
-            local['_id'] = str(local['_id'])
-            resultado.append(local)
+        # As células cobrem uma área maior que o círculo: refinar pela distância exata
+        return GeoProcessamento.locais_proximos(locais, latitude, longitude, raio_km)
+    
+    def get_locais_em_poligono(self, poligono: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Retorna os locais dentro de um Polygon/MultiPolygon GeoJSON (índice 2dsphere)"""
+        return list(self.iter_locais(self._filtro_poligono(poligono)))
+    
+    def get_all_locais(self, formato: str = "registros", campos: Optional[List[str]] = None
+                       ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
+        """Retorna todos os locais ativos (formato "dataframe"/"arrays": ver consultar_colunar)"""
+        return self._ler(None, formato, campos)
+    
+    def _ler(self, filtro: Optional[Dict[str, Any]], formato: str, campos: Optional[List[str]] = None):
+        """Lê os locais do filtro como lista de documentos ou no modo colunar"""
+        if formato == "registros":
+            return list(self.iter_locais(filtro, campos))
+        return self.consultar_colunar(filtro, campos, formato)
+    
+    def consultar_colunar(self, filtro: Optional[Dict[str, Any]] = None, campos: Optional[List[str]] = None,
+                          formato: str = "dataframe", batch_size: int = 5000
+                          ) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+        """
+        Lê os locais ativos em formato colunar, já achatados pelo próprio MongoDB
         
-        return resultado
+        Um estágio $project devolve o _id como texto e as coordenadas como
+        latitude/longitude, então não há reescrita de _id por documento nem
+        json_normalize depois.
+        
+        Args:
+            filtro: Filtro adicional do MongoDB
+            campos: Campos lidos (padrão: CAMPOS_COLUNARES; [] lê só o _id, mais as
+                    coordenadas no formato "arrays"); "coordenadas" vira as
+                    colunas latitude e longitude
+            formato: "dataframe" ou "arrays" (dicionário coluna -> array NumPy,
+                     com latitude/longitude em float e só os locais com coordenadas)
+            batch_size: Documentos por lote do cursor
+        
+        Returns:
+            DataFrame ou dicionário de arrays, com a coluna _id
+        """
+        pipeline, colunas = self._pipeline_colunar(filtro, campos, formato)
+        return self._montar_colunar(self.collection.aggregate(pipeline, batchSize=batch_size),
+                                    colunas, formato)
+    
+    def iter_locais(self, filtro: Optional[Dict[str, Any]] = None, campos: Optional[List[str]] = None,
+                    batch_size: int = 1000, limite: int = 0) -> Iterator[Dict[str, Any]]:
+        """Percorre os locais ativos direto do cursor, em lotes e só com os campos pedidos (e o _id)"""
+        consulta, projecao = self._consulta_ativos(filtro, campos)
+        
+        for local in self.collection.find(consulta, projecao, batch_size=batch_size, limit=limite):
+            local['_id'] = str(local['_id'])  # Converter ObjectId para string
+            yield local
     
-    def get_all_locais(self) -> List[Dict[str, Any]]:
-        """Retorna todos os locais ativos"""
-        locais = self.collection.find({"ativo": True})
+    def listar_locais_pagina(self, tamanho: int = 50, apos: Optional[Tuple[Any, str]] = None,
+                             ordenar_por: str = "_id", decrescente: bool = False
+                             ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
+        """Retorna uma página de locais por paginação por chave (seek) e o cursor da próxima página"""
+        consulta, ordenacao = self._consulta_pagina(apos, ordenar_por, decrescente)
         
-        resultado = []
-        for local in locais:
+        # Um documento a mais indica se existe próxima página
+        locais = []
+        for local in self.collection.find(consulta).sort(ordenacao).limit(tamanho + 1):
             local['_id'] = str(local['_id'])
-            resultado.append(local)
+            locais.append(local)
         
-        return resultado
+        return self._fechar_pagina(locais, tamanho, ordenar_por)
     
     def get_local_by_id(self, local_id: str) -> Optional[Dict[str, Any]]:
         """Retorna um local específico pelo ID"""
@@ -88,14 +598,18 @@ class MongoDB:
         from bson import ObjectId
         
         try:
-            # Remover campos que não devem ser atualizados
-            dados_atualizacao.pop('_id', None)
-            dados_atualizacao.pop('data_cadastro', None)
-            
             resultado = self.collection.update_one(
                 {"_id": ObjectId(local_id)},
-                {"$set": dados_atualizacao}
+                {"$set": self._preparar_atualizacao(dados_atualizacao)}
             )
+            
+            if self.indice_espacial is not None and resultado.modified_count > 0:
+                local = self.get_local_by_id(local_id)
+                if local:
+                    self.indice_espacial.inserir(local)
+                else:
+                    self.indice_espacial.remover(local_id)
+            
             return resultado.modified_count > 0
         except:
             return False
@@ -105,45 +619,174 @@ class MongoDB:
         from bson import ObjectId
         
         try:
-            resultado = self.collection.update_one(
-                {"_id": ObjectId(local_id)},
-                {"$set": {"ativo": False}}
-            )
+            resultado = self.collection.update_one({"_id": ObjectId(local_id)}, self._atualizacao_remocao())
+            
+            if self.indice_espacial is not None:
+                self.indice_espacial.remover(local_id)
+            
             return resultado.modified_count > 0
         except:
             return False
     
-    def search_locais(self, termo: str) -> List[Dict[str, Any]]:
-        """Busca locais por nome ou descrição"""
-        locais = self.collection.find({
-            "$or": [
-                {"nome_local": {"$regex": termo, "$options": "i"}},
-                {"descricao": {"$regex": termo, "$options": "i"}},
-                {"categoria": {"$regex": termo, "$options": "i"}}
-            ],
-            "ativo": True
-        })
+    def desativar_locais(self, filtro: Dict[str, Any], tamanho_lote: int = 1000) -> int:
+        """Remove (soft delete) todos os locais ativos que atendem ao filtro; retorna a quantidade"""
+        consulta = dict(filtro, ativo=True)
+        atualizacao = self._atualizacao_remocao()
+        if self.indice_espacial is None:
+            return self.collection.update_many(consulta, atualizacao).modified_count
         
-        resultado = []
-        for local in locais:
-            local['_id'] = str(local['_id'])
-            resultado.append(local)
+        # Com o índice espacial em memória os ids são lidos do cursor um lote por vez
+        desativados = 0
+        for ids in self._lotes_de_ids(consulta, tamanho_lote):
+            desativados += self.collection.update_many(
+                {"_id": {"$in": ids}, "ativo": True}, atualizacao
+            ).modified_count
+            for local_id in ids:
+                self.indice_espacial.remover(str(local_id))
+        
+        return desativados
+    
+    def restaurar_locais(self, filtro: Dict[str, Any], do_arquivo: bool = False,
+                         tamanho_lote: int = 1000) -> int:
+        """Reativa os locais removidos que atendem ao filtro (do_arquivo: traz de volta os arquivados)"""
+        if do_arquivo:
+            self._mover_em_lotes(self.arquivo, self.collection, filtro, tamanho_lote,
+                                 remover_campos=("data_arquivamento",))
+        
+        consulta = dict(filtro, ativo=False)
+        atualizacao = self._atualizacao_restauracao()
+        if self.indice_espacial is None:
+            return self.collection.update_many(consulta, atualizacao).modified_count
         
-        return resultado
+        restaurados = 0
+        for ids in self._lotes_de_ids(consulta, tamanho_lote):
+            restaurados += self.collection.update_many(
+                {"_id": {"$in": ids}, "ativo": False}, atualizacao
+            ).modified_count
+            for local in self.iter_locais({"_id": {"$in": ids}}):
+                self.indice_espacial.inserir(local)
+        
+        return restaurados
+    
+    def _lotes_de_ids(self, consulta: Dict[str, Any], tamanho_lote: int) -> Iterator[List[Any]]:
+        """Percorre o cursor dos _id que atendem à consulta, entregando listas de até `tamanho_lote`"""
+        cursor = self.collection.find(consulta, {"_id": 1}, batch_size=tamanho_lote)
+        return self._em_lotes((local['_id'] for local in cursor), tamanho_lote)
     
-    def get_locais_by_categoria(self, categoria: str) -> List[Dict[str, Any]]:
+    def compactar_locais(self, idade_minima_dias: float = 30, tamanho_lote: int = 1000) -> int:
+        """
+        Move para locais_arquivo os locais removidos há mais de `idade_minima_dias`
+        
+        Locais removidos antes de existir o campo data_remocao recebem a data
+        de agora e só são arquivados depois de completar a idade mínima.
+        
+        Args:
+            idade_minima_dias: Há quantos dias o local precisa estar removido
+            tamanho_lote: Documentos movidos por vez
+        
+        Returns:
+            Quantidade de locais arquivados
+        """
+        agora = datetime.now()
+        sem_data, antigos = self._filtros_compactacao(agora, idade_minima_dias)
+        self.collection.update_many(sem_data, {"$set": {"data_remocao": agora}})
+        
+        return self._mover_em_lotes(self.collection, self.arquivo, antigos, tamanho_lote,
+                                    marcar_campos={"data_arquivamento": agora})
+    
+    def _mover_em_lotes(self, origem, destino, filtro: Dict[str, Any], tamanho_lote: int,
+                        marcar_campos: Optional[Dict[str, Any]] = None,
+                        remover_campos: Tuple[str, ...] = ()) -> int:
+        """Copia os documentos do filtro para `destino` e os apaga de `origem`, um lote por vez"""
+        movidos = 0
+        while True:
+            lote = list(origem.find(filtro, limit=tamanho_lote))
+            if not lote:
+                return movidos
+            
+            destino.bulk_write(self._preparar_movidos(lote, marcar_campos, remover_campos), ordered=False)
+            
+            ids = [documento['_id'] for documento in lote]
+            apagados = origem.delete_many(dict(filtro, _id={"$in": ids})).deleted_count
+            
+            # Documentos alterados entre a cópia e a remoção continuam só na origem
+            if apagados < len(ids):
+                restantes = [documento['_id'] for documento in origem.find({"_id": {"$in": ids}}, {"_id": 1})]
+                destino.delete_many({"_id": {"$in": restantes}})
+            
+            movidos += apagados
+    
+    def search_locais(self, termo: str, limite: int = 0, modo: str = "regex") -> List[Dict[str, Any]]:
+        """Busca locais por nome, descrição ou categoria (modo "texto" ordena por relevância em `score`; limite 0 = sem limite)"""
+        consulta, projecao, ordenacao = self._consulta_busca(termo, modo)
+        cursor = self.collection.find(consulta, projecao, limit=limite)
+        if ordenacao:
+            cursor = cursor.sort(ordenacao)
+        
+        locais = []
+        for local in cursor:
+            local['_id'] = str(local['_id'])  # Converter ObjectId para string
+            locais.append(local)
+        return locais
+    
+    def get_locais_by_categoria(self, categoria: str, formato: str = "registros"
+                                ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
         """Retorna locais de uma categoria específica"""
-        locais = self.collection.find({
-            "categoria": {"$regex": categoria, "$options": "i"},
-            "ativo": True
-        })
+        return self._ler({"categoria_norm": normalizar_texto(categoria)}, formato)
+    
+    def k_mais_proximos(self, latitude: float, longitude: float, k: int = 5,
+                        categoria: str = None) -> List[Dict[str, Any]]:
+        """Retorna os k locais ativos mais próximos de uma coordenada"""
+        if self.indice_espacial is not None:
+            return self.indice_espacial.k_mais_proximos(latitude, longitude, k, categoria)
         
-        resultado = []
-        for local in locais:
-            local['_id'] = str(local['_id'])
-            resultado.append(local)
+        # O servidor devolve só os k primeiros; a distância geodésica é calculada aqui
+        locais = list(self.iter_locais(self._filtro_k_proximos(latitude, longitude, categoria), limite=k))
         
-        return resultado
+        return GeoProcessamento.k_mais_proximos(locais, latitude, longitude, k)
+    
+    def agregar_grade(self, tamanho_celula: float,
+                      caixa: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str, Any]]:
+        """Conta os locais por célula de uma grade fixa no próprio MongoDB (pipeline $group)"""
+        return [
+            self._celula_agregada(celula, tamanho_celula)
+            for celula in self.collection.aggregate(self._pipeline_grade(tamanho_celula, caixa))
+        ]
+    
+    def contar_locais(self) -> int:
+        """Conta os locais ativos no servidor, sem ler os documentos"""
+        return self.collection.count_documents({"ativo": True})
+    
+    def contar_por_campo(self, campo: str, limite: int = 0) -> List[Dict[str, Any]]:
+        """Conta os locais ativos por valor de `campo`, do mais frequente ao menos ($group no servidor)"""
+        return list(self.collection.aggregate(self._pipeline_contagem(campo, limite)))
+    
+    def estatisticas_coordenadas(self) -> Dict[str, Any]:
+        """Calcula no servidor as estatísticas de GeoProcessamento.estatisticas_geograficas"""
+        grupos = list(self.collection.aggregate(self._pipeline_estatisticas()))
+        return self._resultado_estatisticas(grupos)
+    
+    def atualizar_clusters(self, local_ids: List[str], clusters: List[int],
+                           tamanho_lote: int = 1000) -> int:
+        """Grava o cluster de cada local (campo 'cluster') em lotes de bulk_write"""
+        from bson import ObjectId
+        
+        return self._executar_em_lotes((
+            UpdateOne({"_id": ObjectId(local_id)}, {"$set": {"cluster": int(cluster)}})
+            for local_id, cluster in zip(local_ids, clusters)
+        ), tamanho_lote)
+    
+    def limpar_clusters_sem_coordenadas(self) -> int:
+        """Marca como ruído (cluster -1) os locais sem coordenadas que ainda guardam um cluster antigo"""
+        return self.collection.update_many(
+            {"ativo": True, "cluster": {"$gte": 0}, "$nor": [self.COM_COORDENADAS]},
+            {"$set": {"cluster": -1}}
+        ).modified_count
+    
+    def construir_indice_espacial(self, tamanho_celula: float = 0.1) -> IndiceEspacial:
+        """Constrói o índice espacial em memória com todos os locais ativos"""
+        self.indice_espacial = IndiceEspacial.construir(self.get_all_locais(), tamanho_celula)
+        return self.indice_espacial
     
     def populate_sample_data(self):
         """Popula o banco com dados de exemplo"""
@@ -214,9 +857,9 @@ class MongoDB:
             }
         ]
         
-        # Inserir locais de exemplo
-        for local in locais_exemplo:
-            self.insert_local(
+        # Inserir locais de exemplo em um único lote
+        self._inserir_lote([
+            self._montar_documento(
                 local["nome_local"],
                 local["cidade"],
                 local["coordenadas"]["latitude"],
@@ -225,7 +868,156 @@ class MongoDB:
                 local["categoria"],
                 local["endereco"]
             )
+            for local in locais_exemplo
+        ])
+    
+    def importar_locais(self, arquivo: Union[str, IO], formato: Optional[str] = None,
+                        tamanho_lote: int = 1000,
+                        progresso: Optional[Callable[[int, int], None]] = None,
+                        relatorio_rejeitados: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Importa locais de um arquivo JSONL ou CSV em lotes
+        
+        O arquivo é lido como fluxo: apenas um lote fica na memória por vez.
+        Cada linha precisa de nome_local, cidade, latitude e longitude (no CSV
+        como colunas; no JSONL no topo do objeto ou dentro de 'coordenadas');
+        descricao, categoria e endereco são opcionais.
+        
+        Args:
+            arquivo: Caminho ou arquivo aberto (texto ou binário)
+            formato: "jsonl" ou "csv" (padrão: deduzido pela extensão)
+            tamanho_lote: Documentos por insert_many
+            progresso: Função chamada após cada lote com (inseridos, rejeitados)
+            relatorio_rejeitados: Caminho de um CSV para gravar as linhas rejeitadas
+        
+        Returns:
+            Dicionário com 'inseridos', 'rejeitados' e 'amostra_rejeitados'
+            (as primeiras linhas rejeitadas, com número da linha e motivo)
+        """
+        nome = arquivo if isinstance(arquivo, str) else getattr(arquivo, 'name', '')
+        formato = (formato or os.path.splitext(nome)[1].lstrip('.')).lower()
+        if formato not in ("jsonl", "csv"):
+            raise ValueError("Formato de importação deve ser 'jsonl' ou 'csv'")
+        
+        resumo = {"inseridos": 0, "rejeitados": 0, "amostra_rejeitados": []}
+        
+        with contextlib.ExitStack() as pilha:
+            if isinstance(arquivo, str):
+                arquivo = pilha.enter_context(open(arquivo, encoding='utf-8', newline=''))
+            elif isinstance(arquivo.read(0), bytes):
+                arquivo = io.TextIOWrapper(arquivo, encoding='utf-8', newline='')
+            
+            escritor = None
+            if relatorio_rejeitados:
+                saida = pilha.enter_context(open(relatorio_rejeitados, 'w', encoding='utf-8', newline=''))
+                escritor = csv.writer(saida)
+                escritor.writerow(["linha", "motivo", "conteudo"])
+            
+            def rejeitar(numero_linha: int, motivo: str, conteudo: Any):
+                resumo["rejeitados"] += 1
+                if len(resumo["amostra_rejeitados"]) < 100:
+                    resumo["amostra_rejeitados"].append({"linha": numero_linha, "motivo": motivo})
+                if escritor:
+                    escritor.writerow([numero_linha, motivo, json.dumps(conteudo, ensure_ascii=False, default=str)])
+            
+            if formato == "csv":
+                # Linha 1 é o cabeçalho
+                linhas = enumerate(csv.DictReader(arquivo), start=2)
+            else:
+                linhas = enumerate(arquivo, start=1)
+            
+            documentos: List[Dict[str, Any]] = []
+            numeros: List[int] = []
+            originais: List[Any] = []
+            
+            def gravar_lote():
+                inseridos, erros = self._inserir_lote(documentos)
+                resumo["inseridos"] += inseridos
+                for posicao, erro in erros.items():
+                    rejeitar(numeros[posicao], erro, originais[posicao])
+                documentos.clear()
+                numeros.clear()
+                originais.clear()
+                if progresso:
+                    progresso(resumo["inseridos"], resumo["rejeitados"])
+            
+            for numero_linha, linha in linhas:
+                if formato == "jsonl":
+                    if not linha.strip():
+                        continue
+                    try:
+                        linha = json.loads(linha)
+                    except ValueError as e:
+                        rejeitar(numero_linha, f"JSON inválido: {e}", linha.strip())
+                        continue
+                
+                try:
+                    documento = self._documento_importado(linha)
+                except (KeyError, TypeError, ValueError) as e:
+                    rejeitar(numero_linha, str(e), linha)
+                    continue
+                
+                documentos.append(documento)
+                numeros.append(numero_linha)
+                originais.append(linha)
+                if len(documentos) >= tamanho_lote:
+                    gravar_lote()
+            
+            if documentos:
+                gravar_lote()
+        
+        return resumo
+    
+    def _documento_importado(self, linha: Dict[str, Any]) -> Dict[str, Any]:
+        """Valida uma linha importada e monta o documento (ValueError se inválida)"""
+        if not isinstance(linha, dict):
+            raise ValueError("Linha não é um objeto")
+        
+        coordenadas = linha.get("coordenadas") or linha
+        try:
+            latitude = float(coordenadas["latitude"])
+            longitude = float(coordenadas["longitude"])
+        except KeyError as e:
+            raise ValueError(f"Campo obrigatório ausente: {e.args[0]}")
+        except (TypeError, ValueError):
+            raise ValueError("Coordenadas não numéricas")
+        
+        if not GeoProcessamento.validar_coordenadas(latitude, longitude):
+            raise ValueError("Coordenadas fora dos limites")
+        
+        for campo in ("nome_local", "cidade"):
+            if not str(linha.get(campo) or "").strip():
+                raise ValueError(f"Campo obrigatório ausente: {campo}")
+        
+        return self._montar_documento(
+            str(linha["nome_local"]).strip(),
+            str(linha["cidade"]).strip(),
+            latitude,
+            longitude,
+            linha.get("descricao") or "",
+            linha.get("categoria") or "",
+            linha.get("endereco") or ""
+        )
     
     def close_connection(self):
         """Fecha a conexão com o MongoDB"""
         self.client.close()
+
+
+if __name__ == "__main__":
+    # Manutenção pela linha de comando, ex.: python db_mongo.py compactar --dias 30
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Manutenção da coleção de locais")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    compactar = comandos.add_parser("compactar", help="Arquiva os locais removidos há mais de N dias")
+    compactar.add_argument("--dias", type=float, default=30, help="Idade mínima da remoção (padrão: 30)")
+    compactar.add_argument("--lote", type=int, default=1000, help="Documentos movidos por vez (padrão: 1000)")
+    argumentos = parser.parse_args()
+    
+    mongo_db = MongoDB()
+    try:
+        arquivados = mongo_db.compactar_locais(argumentos.dias, argumentos.lote)
+        print(f"{arquivados} locais movidos para locais_arquivo")
+    finally:
+        mongo_db.close_connection()
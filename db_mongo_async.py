@@ -0,0 +1,368 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Iterable, Union
+import asyncio
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from db_mongo import ConsultasLocais
+from geoprocessamento import GeoProcessamento, IndiceEspacial, normalizar_texto
+
+
+class MongoDBAsync(ConsultasLocais):
+    """
+    Versão assíncrona (Motor/asyncio) da camada de acesso do MongoDB
+    
+    Os métodos têm os mesmos nomes, parâmetros e retornos de MongoDB, mas são
+    corrotinas; filtros, pipelines e documentos vêm da base ConsultasLocais.
+    Migrações, criação de índices, importação e dados de exemplo continuam só
+    na classe síncrona, que deve ser inicializada antes.
+    """
+    
+    def __init__(self, connection_string: str = None, db_name: str = "geolocalizacao"):
+        # Usar string de conexão do ambiente ou padrão
+        if connection_string is None:
+            connection_string = os.getenv('MONGODB_CONNECTION_STRING', 'mongodb://localhost:27017/')
+        self.client = AsyncIOMotorClient(connection_string)
+        self.db = self.client[db_name]
+        self.collection = self.db.locais
+        # Locais removidos há tempo suficiente saem da coleção principal para cá
+        self.arquivo = self.db.locais_arquivo
+        # Índice espacial em memória, construído sob demanda
+        self.indice_espacial: Optional[IndiceEspacial] = None
+    
+    async def _executar_em_lotes(self, operacoes: Iterable[UpdateOne], tamanho_lote: int = 1000) -> int:
+        """Envia operações de escrita em lotes de bulk_write não ordenados"""
+        modificados = 0
+        for lote in self._em_lotes(operacoes, tamanho_lote):
+            modificados += (await self.collection.bulk_write(lote, ordered=False)).modified_count
+        return modificados
+    
+    async def insert_local(self, nome_local: str, cidade: str, latitude: float, longitude: float,
+                           descricao: str = "", categoria: str = "", endereco: str = "") -> str:
+        """Insere um novo local no MongoDB"""
+        documento = self._montar_documento(nome_local, cidade, latitude, longitude,
+                                           descricao, categoria, endereco)
+        
+        resultado = await self.collection.insert_one(documento)
+        
+        if self.indice_espacial is not None:
+            documento['_id'] = str(resultado.inserted_id)
+            self.indice_espacial.inserir(documento)
+        
+        return str(resultado.inserted_id)
+    
+    async def get_locais_by_cidade(self, cidade: str, formato: str = "registros"
+                                   ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
+        """Retorna todos os locais de uma cidade específica"""
+        return await self._ler({"cidade_norm": normalizar_texto(cidade)}, formato)
+    
+    async def get_locais_by_coordenadas(self, latitude: float, longitude: float,
+                                        raio_km: float = 10) -> List[Dict[str, Any]]:
+        """Retorna locais dentro do raio, já ordenados por distância (índice 2dsphere)"""
+        return [local async for local in self.iter_locais(self._filtro_raio(latitude, longitude, raio_km))]
+    
+    async def get_locais_por_geohash(self, latitude: float, longitude: float,
+                                     raio_km: float = 10) -> List[Dict[str, Any]]:
+        """Busca por raio com varreduras de faixa no índice de geohash, já com distância calculada"""
+        locais = [local async for local in self.iter_locais(self._filtro_geohash(latitude, longitude, raio_km))]
+        
+        # As células cobrem uma área maior que o círculo: refinar pela distância exata
+        return GeoProcessamento.locais_proximos(locais, latitude, longitude, raio_km)
+    
+    async def get_locais_em_poligono(self, poligono: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Retorna os locais dentro de um Polygon/MultiPolygon GeoJSON (índice 2dsphere)"""
+        return [local async for local in self.iter_locais(self._filtro_poligono(poligono))]
+    
+    async def get_all_locais(self, formato: str = "registros", campos: Optional[List[str]] = None
+                             ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
+        """Retorna todos os locais ativos (formato "dataframe"/"arrays": ver consultar_colunar)"""
+        return await self._ler(None, formato, campos)
+    
+    async def _ler(self, filtro: Optional[Dict[str, Any]], formato: str, campos: Optional[List[str]] = None):
+        """Lê os locais do filtro como lista de documentos ou no modo colunar"""
+        if formato == "registros":
+            return [local async for local in self.iter_locais(filtro, campos)]
+        return await self.consultar_colunar(filtro, campos, formato)
+    
+    async def consultar_colunar(self, filtro: Optional[Dict[str, Any]] = None, campos: Optional[List[str]] = None,
+                                formato: str = "dataframe", batch_size: int = 5000
+                                ) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+        """Lê os locais ativos em formato colunar, já achatados pelo próprio MongoDB (ver MongoDB.consultar_colunar)"""
+        pipeline, colunas = self._pipeline_colunar(filtro, campos, formato)
+        documentos = await self.collection.aggregate(pipeline, batchSize=batch_size).to_list(None)
+        return self._montar_colunar(documentos, colunas, formato)
+    
+    async def iter_locais(self, filtro: Optional[Dict[str, Any]] = None, campos: Optional[List[str]] = None,
+                          batch_size: int = 1000, limite: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Percorre os locais ativos direto do cursor, em lotes e só com os campos pedidos (e o _id)"""
+        consulta, projecao = self._consulta_ativos(filtro, campos)
+        
+        async for local in self.collection.find(consulta, projecao, batch_size=batch_size, limit=limite):
+            local['_id'] = str(local['_id'])  # Converter ObjectId para string
+            yield local
+    
+    async def listar_locais_pagina(self, tamanho: int = 50, apos: Optional[Tuple[Any, str]] = None,
+                                   ordenar_por: str = "_id", decrescente: bool = False
+                                   ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
+        """Retorna uma página de locais por paginação por chave (seek) e o cursor da próxima página"""
+        consulta, ordenacao = self._consulta_pagina(apos, ordenar_por, decrescente)
+        
+        # Um documento a mais indica se existe próxima página
+        locais = []
+        async for local in self.collection.find(consulta).sort(ordenacao).limit(tamanho + 1):
+            local['_id'] = str(local['_id'])
+            locais.append(local)
+        
+        return self._fechar_pagina(locais, tamanho, ordenar_por)
+    
+    async def get_local_by_id(self, local_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna um local específico pelo ID"""
+        from bson import ObjectId
+        
+        try:
+            local = await self.collection.find_one({"_id": ObjectId(local_id), "ativo": True})
+            if local:
+                local['_id'] = str(local['_id'])
+            return local
+        except:
+            return None
+    
+    async def update_local(self, local_id: str, dados_atualizacao: Dict[str, Any]) -> bool:
+        """Atualiza um local existente"""
+        from bson import ObjectId
+        
+        try:
+            resultado = await self.collection.update_one(
+                {"_id": ObjectId(local_id)},
+                {"$set": self._preparar_atualizacao(dados_atualizacao)}
+            )
+            
+            if self.indice_espacial is not None and resultado.modified_count > 0:
+                local = await self.get_local_by_id(local_id)
+                if local:
+                    self.indice_espacial.inserir(local)
+                else:
+                    self.indice_espacial.remover(local_id)
+            
+            return resultado.modified_count > 0
+        except:
+            return False
+    
+    async def delete_local(self, local_id: str) -> bool:
+        """Remove um local (soft delete)"""
+        from bson import ObjectId
+        
+        try:
+            resultado = await self.collection.update_one({"_id": ObjectId(local_id)}, self._atualizacao_remocao())
+            
+            if self.indice_espacial is not None:
+                self.indice_espacial.remover(local_id)
+            
+            return resultado.modified_count > 0
+        except:
+            return False
+    
+    async def desativar_locais(self, filtro: Dict[str, Any], tamanho_lote: int = 1000) -> int:
+        """Remove (soft delete) todos os locais ativos que atendem ao filtro; retorna a quantidade"""
+        consulta = dict(filtro, ativo=True)
+        atualizacao = self._atualizacao_remocao()
+        if self.indice_espacial is None:
+            return (await self.collection.update_many(consulta, atualizacao)).modified_count
+        
+        # Com o índice espacial em memória os ids são lidos do cursor um lote por vez
+        desativados = 0
+        async for ids in self._lotes_de_ids(consulta, tamanho_lote):
+            resultado = await self.collection.update_many({"_id": {"$in": ids}, "ativo": True}, atualizacao)
+            desativados += resultado.modified_count
+            for local_id in ids:
+                self.indice_espacial.remover(str(local_id))
+        
+        return desativados
+    
+    async def restaurar_locais(self, filtro: Dict[str, Any], do_arquivo: bool = False,
+                               tamanho_lote: int = 1000) -> int:
+        """Reativa os locais removidos que atendem ao filtro (do_arquivo: traz de volta os arquivados)"""
+        if do_arquivo:
+            await self._mover_em_lotes(self.arquivo, self.collection, filtro, tamanho_lote,
+                                       remover_campos=("data_arquivamento",))
+        
+        consulta = dict(filtro, ativo=False)
+        atualizacao = self._atualizacao_restauracao()
+        if self.indice_espacial is None:
+            return (await self.collection.update_many(consulta, atualizacao)).modified_count
+        
+        restaurados = 0
+        async for ids in self._lotes_de_ids(consulta, tamanho_lote):
+            resultado = await self.collection.update_many({"_id": {"$in": ids}, "ativo": False}, atualizacao)
+            restaurados += resultado.modified_count
+            async for local in self.iter_locais({"_id": {"$in": ids}}):
+                self.indice_espacial.inserir(local)
+        
+        return restaurados
+    
+    async def _lotes_de_ids(self, consulta: Dict[str, Any], tamanho_lote: int) -> AsyncIterator[List[Any]]:
+        """Percorre o cursor dos _id que atendem à consulta, entregando listas de até `tamanho_lote`"""
+        cursor = self.collection.find(consulta, {"_id": 1}, batch_size=tamanho_lote)
+        while True:
+            lote = [local['_id'] for local in await cursor.to_list(length=tamanho_lote)]
+            if not lote:
+                return
+            yield lote
+    
+    async def compactar_locais(self, idade_minima_dias: float = 30, tamanho_lote: int = 1000) -> int:
+        """Move para locais_arquivo os locais removidos há mais de `idade_minima_dias` (ver MongoDB.compactar_locais)"""
+        agora = datetime.now()
+        sem_data, antigos = self._filtros_compactacao(agora, idade_minima_dias)
+        await self.collection.update_many(sem_data, {"$set": {"data_remocao": agora}})
+        
+        return await self._mover_em_lotes(self.collection, self.arquivo, antigos, tamanho_lote,
+                                          marcar_campos={"data_arquivamento": agora})
+    
+    async def _mover_em_lotes(self, origem, destino, filtro: Dict[str, Any], tamanho_lote: int,
+                              marcar_campos: Optional[Dict[str, Any]] = None,
+                              remover_campos: Tuple[str, ...] = ()) -> int:
+        """Copia os documentos do filtro para `destino` e os apaga de `origem`, um lote por vez"""
+        movidos = 0
+        while True:
+            lote = await origem.find(filtro, limit=tamanho_lote).to_list(None)
+            if not lote:
+                return movidos
+            
+            await destino.bulk_write(self._preparar_movidos(lote, marcar_campos, remover_campos), ordered=False)
+            
+            ids = [documento['_id'] for documento in lote]
+            apagados = (await origem.delete_many(dict(filtro, _id={"$in": ids}))).deleted_count
+            
+            # Documentos alterados entre a cópia e a remoção continuam só na origem
+            if apagados < len(ids):
+                restantes = [documento['_id'] async for documento in origem.find({"_id": {"$in": ids}}, {"_id": 1})]
+                await destino.delete_many({"_id": {"$in": restantes}})
+            
+            movidos += apagados
+    
+    async def search_locais(self, termo: str, limite: int = 0, modo: str = "regex") -> List[Dict[str, Any]]:
+        """Busca locais por nome, descrição ou categoria (modo "texto" ordena por relevância em `score`; limite 0 = sem limite)"""
+        consulta, projecao, ordenacao = self._consulta_busca(termo, modo)
+        cursor = self.collection.find(consulta, projecao, limit=limite)
+        if ordenacao:
+            cursor = cursor.sort(ordenacao)
+        
+        locais = []
+        async for local in cursor:
+            local['_id'] = str(local['_id'])  # Converter ObjectId para string
+            locais.append(local)
+        return locais
+    
+    async def get_locais_by_categoria(self, categoria: str, formato: str = "registros"
+                                      ) -> Union[List[Dict[str, Any]], pd.DataFrame, Dict[str, np.ndarray]]:
+        """Retorna locais de uma categoria específica"""
+        return await self._ler({"categoria_norm": normalizar_texto(categoria)}, formato)
+    
+    async def k_mais_proximos(self, latitude: float, longitude: float, k: int = 5,
+                              categoria: str = None) -> List[Dict[str, Any]]:
+        """Retorna os k locais ativos mais próximos de uma coordenada"""
+        if self.indice_espacial is not None:
+            return self.indice_espacial.k_mais_proximos(latitude, longitude, k, categoria)
+        
+        # O servidor devolve só os k primeiros; a distância geodésica é calculada aqui
+        filtro = self._filtro_k_proximos(latitude, longitude, categoria)
+        locais = [local async for local in self.iter_locais(filtro, limite=k)]
+        
+        return GeoProcessamento.k_mais_proximos(locais, latitude, longitude, k)
+    
+    async def agregar_grade(self, tamanho_celula: float,
+                            caixa: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str, Any]]:
+        """Conta os locais por célula de uma grade fixa no próprio MongoDB (pipeline $group)"""
+        return [
+            self._celula_agregada(celula, tamanho_celula)
+            async for celula in self.collection.aggregate(self._pipeline_grade(tamanho_celula, caixa))
+        ]
+    
+    async def contar_locais(self) -> int:
+        """Conta os locais ativos no servidor, sem ler os documentos"""
+        return await self.collection.count_documents({"ativo": True})
+    
+    async def contar_por_campo(self, campo: str, limite: int = 0) -> List[Dict[str, Any]]:
+        """Conta os locais ativos por valor de `campo`, do mais frequente ao menos ($group no servidor)"""
+        return await self.collection.aggregate(self._pipeline_contagem(campo, limite)).to_list(None)
+    
+    async def estatisticas_coordenadas(self) -> Dict[str, Any]:
+        """Calcula no servidor as estatísticas de GeoProcessamento.estatisticas_geograficas"""
+        grupos = await self.collection.aggregate(self._pipeline_estatisticas()).to_list(None)
+        return self._resultado_estatisticas(grupos)
+    
+    async def atualizar_clusters(self, local_ids: List[str], clusters: List[int],
+                                 tamanho_lote: int = 1000) -> int:
+        """Grava o cluster de cada local (campo 'cluster') em lotes de bulk_write"""
+        from bson import ObjectId
+        
+        return await self._executar_em_lotes((
+            UpdateOne({"_id": ObjectId(local_id)}, {"$set": {"cluster": int(cluster)}})
+            for local_id, cluster in zip(local_ids, clusters)
+        ), tamanho_lote)
+    
+    async def limpar_clusters_sem_coordenadas(self) -> int:
+        """Marca como ruído (cluster -1) os locais sem coordenadas que ainda guardam um cluster antigo"""
+        resultado = await self.collection.update_many(
+            {"ativo": True, "cluster": {"$gte": 0}, "$nor": [self.COM_COORDENADAS]},
+            {"$set": {"cluster": -1}}
+        )
+        return resultado.modified_count
+    
+    async def construir_indice_espacial(self, tamanho_celula: float = 0.1) -> IndiceEspacial:
+        """Constrói o índice espacial em memória com todos os locais ativos"""
+        self.indice_espacial = IndiceEspacial.construir(await self.get_all_locais(), tamanho_celula)
+        return self.indice_espacial
+    
+    def close_connection(self):
+        """Fecha a conexão com o MongoDB"""
+        self.client.close()
+
+
+class ExecutorAssincrono:
+    """
+    Laço de eventos em uma thread de fundo para chamar corrotinas a partir de código síncrono
+    
+    O cliente do Motor fica preso ao laço em que é usado pela primeira vez, então
+    todas as chamadas passam pelo mesmo laço (e não por um asyncio.run por chamada,
+    que criaria um laço novo a cada vez).
+    """
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="executor-assincrono",
+                                        daemon=True)
+        self._thread.start()
+    
+    def executar(self, corrotina: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Executa uma corrotina no laço de fundo e espera o resultado"""
+        return asyncio.run_coroutine_threadsafe(corrotina, self.loop).result(timeout)
+    
+    def executar_concorrente(self, *corrotinas: Awaitable[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Executa várias corrotinas ao mesmo tempo e retorna os resultados na mesma ordem
+        
+        O tempo total fica próximo ao da corrotina mais lenta, e não à soma de todas.
+        
+        Args:
+            corrotinas: Corrotinas a executar (ex.: chamadas de MongoDBAsync)
+            timeout: Tempo máximo de espera em segundos (padrão: sem limite)
+        
+        Returns:
+            Lista com o resultado de cada corrotina
+        """
+        async def reunir():
+            return await asyncio.gather(*corrotinas)
+        
+        return self.executar(reunir(), timeout)
+    
+    def fechar(self):
+        """Para o laço de eventos e encerra a thread de fundo"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
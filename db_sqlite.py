@@ -1,129 +1,823 @@
 import sqlite3
+import threading
+import contextlib
+import csv
+import io
+import re
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable, Union, IO
+
+from geoprocessamento import GeoProcessamento
 
 class SQLiteDB:
-    def __init__(self, db_path: str = "cidades.db"):
+    # Pragmas aplicados a cada conexão nova (podem ser sobrescritos no construtor)
+    PRAGMAS_PADRAO = {
+        "journal_mode": "WAL",        # leitores não bloqueiam o escritor (e vice-versa)
+        "synchronous": "NORMAL",      # seguro com WAL e bem mais rápido que FULL
+        "cache_size": -64000,         # ~64 MB de cache de páginas por conexão
+        "mmap_size": 268435456,       # leituras de até 256 MB via memória mapeada
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,         # espera (ms) por um bloqueio antes de falhar
+    }
+    
+    # Soma uma cidade (NEW) ao resumo do seu estado; usado pelos gatilhos de INSERT e UPDATE
+    _SOMAR_RESUMO = '''
+        INSERT INTO estado_resumo (estado_id, quantidade_cidades, populacao_total, area_total)
+        SELECT NEW.estado_id, 1, COALESCE(NEW.populacao, 0), COALESCE(NEW.area_km2, 0)
+        WHERE NEW.estado_id IS NOT NULL
+        ON CONFLICT (estado_id) DO UPDATE SET
+            quantidade_cidades = quantidade_cidades + 1,
+            populacao_total = populacao_total + excluded.populacao_total,
+            area_total = area_total + excluded.area_total;
+    '''
+    
+    # Tira uma cidade (OLD) do resumo do seu estado; usado pelos gatilhos de DELETE e UPDATE
+    _SUBTRAIR_RESUMO = '''
+        UPDATE estado_resumo SET
+            quantidade_cidades = quantidade_cidades - 1,
+            populacao_total = populacao_total - COALESCE(OLD.populacao, 0),
+            area_total = area_total - COALESCE(OLD.area_km2, 0)
+        WHERE estado_id = OLD.estado_id;
+    '''
+    
+    GATILHOS_RESUMO = [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_resumo_insert AFTER INSERT ON cidades
+            BEGIN {_SOMAR_RESUMO} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_resumo_delete AFTER DELETE ON cidades
+            BEGIN {_SUBTRAIR_RESUMO} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_resumo_update
+            AFTER UPDATE OF estado_id, populacao, area_km2 ON cidades
+            BEGIN {_SUBTRAIR_RESUMO} {_SOMAR_RESUMO} END""",
+    ]
+    
+    # Mantêm cidades_fts (nome da cidade, do estado e UF) em sincronia com cidades e estados
+    _INSERIR_FTS = '''
+        INSERT INTO cidades_fts (rowid, nome, estado, uf)
+        SELECT NEW.id, NEW.nome, e.nome, e.uf FROM estados e WHERE e.id = NEW.estado_id;
+    '''
+    
+    GATILHOS_FTS = [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_fts_insert AFTER INSERT ON cidades
+            BEGIN {_INSERIR_FTS} END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_cidades_fts_delete AFTER DELETE ON cidades
+            BEGIN DELETE FROM cidades_fts WHERE rowid = OLD.id; END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_fts_update AFTER UPDATE OF nome, estado_id ON cidades
+            BEGIN DELETE FROM cidades_fts WHERE rowid = OLD.id; {_INSERIR_FTS} END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_estados_fts_update AFTER UPDATE OF nome, uf ON estados
+            BEGIN
+                UPDATE cidades_fts SET estado = NEW.nome, uf = NEW.uf
+                WHERE rowid IN (SELECT id FROM cidades WHERE estado_id = NEW.id);
+            END""",
+    ]
+    
+    # Formatos de retorno das leituras: lista de dicionários ou DataFrame montado direto do cursor
+    FORMATOS = ("registros", "dataframe")
+    
+    # Colunas aceitas como ordenação em filtrar_cidades
+    ORDENACOES_FILTRO = ("nome", "populacao", "area_km2", "id")
+    
+    # Insere a cidade ou, se (nome, estado_id) já existe, atualiza os dados informados
+    SQL_UPSERT_CIDADE = '''
+        INSERT INTO cidades (nome, estado_id, populacao, area_km2, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (nome, estado_id) DO UPDATE SET
+            populacao = COALESCE(excluded.populacao, populacao),
+            area_km2 = COALESCE(excluded.area_km2, area_km2),
+            latitude = COALESCE(excluded.latitude, latitude),
+            longitude = COALESCE(excluded.longitude, longitude)
+    '''
+    
+    # Sem o índice único (bancos antigos com duplicatas) o ON CONFLICT não vale:
+    # atualiza as cidades do mesmo (nome, estado_id) e só insere se não houver nenhuma
+    _ATUALIZAR_CIDADE = '''
+        UPDATE cidades SET
+            populacao = COALESCE(?, populacao),
+            area_km2 = COALESCE(?, area_km2),
+            latitude = COALESCE(?, latitude),
+            longitude = COALESCE(?, longitude)
+        WHERE nome = ? AND estado_id = ?
+    '''
+    _INSERIR_CIDADE = '''
+        INSERT INTO cidades (nome, estado_id, populacao, area_km2, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    
+    # Grupos (nome, estado) com mais de uma cidade, que impedem o índice único
+    SQL_CIDADES_DUPLICADAS = '''
+        SELECT c.nome, e.uf, COUNT(*) AS quantidade, GROUP_CONCAT(c.id, ', ') AS ids
+        FROM cidades c
+        LEFT JOIN estados e ON c.estado_id = e.id
+        WHERE c.estado_id IS NOT NULL
+        GROUP BY c.nome, c.estado_id
+        HAVING COUNT(*) > 1
+        ORDER BY c.nome
+    '''
+    
+    # Mantêm cidades_rtree (um ponto por cidade com coordenadas) em sincronia com cidades
+    _INSERIR_RTREE = '''
+        INSERT INTO cidades_rtree (id, lat_min, lat_max, lon_min, lon_max)
+        SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    '''
+    
+    GATILHOS_RTREE = [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_rtree_insert AFTER INSERT ON cidades
+            BEGIN {_INSERIR_RTREE} END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_cidades_rtree_delete AFTER DELETE ON cidades
+            BEGIN DELETE FROM cidades_rtree WHERE id = OLD.id; END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_cidades_rtree_update
+            AFTER UPDATE OF latitude, longitude ON cidades
+            BEGIN DELETE FROM cidades_rtree WHERE id = OLD.id; {_INSERIR_RTREE} END""",
+    ]
+    
+    def __init__(self, db_path: str = "cidades.db", pragmas: Optional[Dict[str, Any]] = None):
         self.db_path = db_path
+        self.pragmas = {**self.PRAGMAS_PADRAO, **(pragmas or {})}
+        
+        # Uma conexão persistente por thread, registrada para poder ser fechada depois
+        self._local = threading.local()
+        self._conexoes: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._trava = threading.Lock()
+        
         self.init_database()
     
-    def init_database(self):
-        """Inicializa o banco de dados SQLite com as tabelas necessárias"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _conexao(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual, abrindo-a (com os pragmas) no primeiro uso"""
+        conn = getattr(self._local, 'conexao', None)
+        if conn is not None:
+            return conn
         
-        # Criar tabela de estados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS estados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL,
-                uf TEXT NOT NULL UNIQUE
-            )
-        ''')
+        # Autocommit: as transações são abertas explicitamente por transacao()
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        for pragma, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {valor}")
         
-        # Criar tabela de cidades
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cidades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL,
-                estado_id INTEGER,
-                populacao INTEGER,
-                area_km2 REAL,
-                FOREIGN KEY (estado_id) REFERENCES estados (id)
-            )
-        ''')
+        with self._trava:
+            # Fechar as conexões de threads que já terminaram
+            for thread in [t for t in self._conexoes if not t.is_alive()]:
+                self._conexoes.pop(thread).close()
+            self._conexoes[threading.current_thread()] = conn
         
-        conn.commit()
-        conn.close()
+        self._local.conexao = conn
+        self._local.profundidade = 0
+        return conn
     
-    def insert_estado(self, nome: str, uf: str) -> int:
-        """Insere um novo estado e retorna o ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @contextlib.contextmanager
+    def transacao(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Executa o bloco em uma transação: confirma no fim ou desfaz se houver exceção
+        
+        A transação externa começa com BEGIN IMMEDIATE (reserva a escrita logo no
+        início); blocos aninhados viram SAVEPOINTs dentro dela.
+        
+        Yields:
+            Cursor da conexão da thread atual
+        """
+        conn = self._conexao()
+        profundidade = self._local.profundidade
+        ponto = f"sp_{profundidade}"
         
+        conn.execute("BEGIN IMMEDIATE" if profundidade == 0 else f"SAVEPOINT {ponto}")
+        self._local.profundidade += 1
         try:
-            cursor.execute("INSERT INTO estados (nome, uf) VALUES (?, ?)", (nome, uf))
-            estado_id = cursor.lastrowid
-            conn.commit()
-            return estado_id
-        except sqlite3.IntegrityError:
-            # Estado já existe, buscar o ID
-            cursor.execute("SELECT id FROM estados WHERE uf = ?", (uf,))
-            estado_id = cursor.fetchone()[0]
-            return estado_id
+            yield conn.cursor()
+        except BaseException:
+            if profundidade == 0:
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO {ponto}")
+                conn.execute(f"RELEASE {ponto}")
+            raise
+        else:
+            conn.execute("COMMIT" if profundidade == 0 else f"RELEASE {ponto}")
         finally:
-            conn.close()
+            self._local.profundidade -= 1
     
-    def insert_cidade(self, nome: str, estado_uf: str, populacao: int = None, area_km2: float = None) -> int:
-        """Insere uma nova cidade e retorna o ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _consultar(self, sql: str, parametros: tuple = (),
+                   formato: str = "registros") -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """Executa um SELECT na conexão da thread e retorna as linhas como dicionários ou DataFrame"""
+        if formato not in self.FORMATOS:
+            raise ValueError(f"Formato não suportado: {formato}")
         
-        # Buscar ou criar estado
-        estado_id = self.insert_estado("", estado_uf)  # Nome será atualizado depois
+        cursor = self._conexao().execute(sql, parametros)
+        colunas = [desc[0] for desc in cursor.description]
         
-        try:
+        if formato == "dataframe":
+            # As tuplas do cursor vão direto para as colunas, sem um dicionário por linha
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=colunas)
+        return [dict(zip(colunas, row)) for row in cursor.fetchall()]
+    
+    def close_connection(self):
+        """Fecha as conexões abertas por todas as threads"""
+        with self._trava:
+            for conn in self._conexoes.values():
+                conn.close()
+            self._conexoes.clear()
+        self._local = threading.local()
+    
+    def init_database(self):
+        """Inicializa o banco de dados SQLite com as tabelas necessárias"""
+        with self.transacao() as cursor:
+            # Criar tabela de estados
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS estados (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL,
+                    uf TEXT NOT NULL UNIQUE
+                )
+            ''')
+            
+            # Criar tabela de cidades
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cidades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL,
+                    estado_id INTEGER,
+                    populacao INTEGER,
+                    area_km2 REAL,
+                    FOREIGN KEY (estado_id) REFERENCES estados (id)
+                )
+            ''')
+            
+            # Migração: coordenadas das cidades (bancos criados antes não têm as colunas)
+            colunas = {linha[1] for linha in cursor.execute("PRAGMA table_info(cidades)")}
+            for coluna in ("latitude", "longitude"):
+                if coluna not in colunas:
+                    cursor.execute(f"ALTER TABLE cidades ADD COLUMN {coluna} REAL")
+            
+            # Índice para a paginação por chave (o id já vem junto, como rowid)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cidades_nome ON cidades (nome)")
+            
+            # Uma cidade por (nome, estado): o índice único só é criado sem duplicatas
+            # antigas; se houver, ficam relatadas em cidades_duplicadas até que
+            # mesclar_cidades_duplicadas seja executada (nada é apagado aqui)
+            self.cidades_duplicadas = self._criar_indice_unico_cidades(cursor)
+            
+            # Índices dos filtros de filtrar_cidades
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cidades_estado ON cidades (estado_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cidades_nome_nocase ON cidades (nome COLLATE NOCASE)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cidades_populacao ON cidades (populacao)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cidades_area ON cidades (area_km2)")
+            
+            # Resumo por estado mantido por gatilhos em cidades
             cursor.execute(
-                "INSERT INTO cidades (nome, estado_id, populacao, area_km2) VALUES (?, ?, ?, ?)",
-                (nome, estado_id, populacao, area_km2)
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'estado_resumo'"
             )
-            cidade_id = cursor.lastrowid
-            conn.commit()
-            return cidade_id
-        finally:
-            conn.close()
+            resumo_novo = cursor.fetchone() is None
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS estado_resumo (
+                    estado_id INTEGER PRIMARY KEY REFERENCES estados (id),
+                    quantidade_cidades INTEGER NOT NULL DEFAULT 0,
+                    populacao_total INTEGER NOT NULL DEFAULT 0,
+                    area_total REAL NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            for gatilho in self.GATILHOS_RESUMO:
+                cursor.execute(gatilho)
+            
+            if resumo_novo:
+                self._reconstruir_estado_resumo(cursor)
+            
+            # Índice espacial R*Tree das coordenadas das cidades
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cidades_rtree'"
+            )
+            rtree_novo = cursor.fetchone() is None
+            
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS cidades_rtree USING rtree(id, lat_min, lat_max, lon_min, lon_max)"
+            )
+            for gatilho in self.GATILHOS_RTREE:
+                cursor.execute(gatilho)
+            
+            if rtree_novo:
+                cursor.execute('''
+                    INSERT INTO cidades_rtree (id, lat_min, lat_max, lon_min, lon_max)
+                    SELECT id, latitude, latitude, longitude, longitude FROM cidades
+                    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                ''')
+            
+            # Busca textual FTS5 sem acentos/maiúsculas, com índices de prefixo
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cidades_fts'"
+            )
+            fts_novo = cursor.fetchone() is None
+            
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS cidades_fts USING fts5(
+                    nome, estado, uf,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3 4'
+                )
+            ''')
+            for gatilho in self.GATILHOS_FTS:
+                cursor.execute(gatilho)
+            
+            if fts_novo:
+                cursor.execute('''
+                    INSERT INTO cidades_fts (rowid, nome, estado, uf)
+                    SELECT c.id, c.nome, e.nome, e.uf FROM cidades c JOIN estados e ON c.estado_id = e.id
+                ''')
     
-    def get_cidades(self) -> List[Dict[str, Any]]:
-        """Retorna todas as cidades com informações do estado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _criar_indice_unico_cidades(self, cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+        """Cria o índice único (nome, estado_id) se possível e retorna as duplicatas que o impedem"""
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_cidades_nome_estado'"
+        )
+        if cursor.fetchone() is not None:
+            return []
         
-        cursor.execute('''
-            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2
+        cursor.execute(self.SQL_CIDADES_DUPLICADAS)
+        colunas = [desc[0] for desc in cursor.description]
+        duplicadas = [dict(zip(colunas, row)) for row in cursor.fetchall()]
+        if not duplicadas:
+            cursor.execute("CREATE UNIQUE INDEX idx_cidades_nome_estado ON cidades (nome, estado_id)")
+        return duplicadas
+    
+    def mesclar_cidades_duplicadas(self) -> int:
+        """
+        Migração explícita: mescla as cidades repetidas (mesmo nome e estado) e cria o índice único
+        
+        Em cada grupo permanece a cidade de menor id; população, área e coordenadas
+        que faltarem nela são preenchidas com as da repetida mais recente que as
+        tenha, e as repetidas são removidas (os gatilhos atualizam resumo, R*Tree e FTS).
+        
+        Returns:
+            Quantidade de cidades removidas
+        """
+        removidas = 0
+        with self.transacao() as cursor:
+            grupos = cursor.execute('''
+                SELECT nome, estado_id FROM cidades WHERE estado_id IS NOT NULL
+                GROUP BY nome, estado_id HAVING COUNT(*) > 1
+            ''').fetchall()
+            
+            for nome, estado_id in grupos:
+                cidades = cursor.execute('''
+                    SELECT id, populacao, area_km2, latitude, longitude FROM cidades
+                    WHERE nome = ? AND estado_id = ? ORDER BY id
+                ''', (nome, estado_id)).fetchall()
+                (mantida, populacao, area_km2, latitude, longitude), repetidas = cidades[0], cidades[1:]
+                
+                for _, outra_populacao, outra_area, outra_lat, outra_lon in reversed(repetidas):
+                    populacao = outra_populacao if populacao is None else populacao
+                    area_km2 = outra_area if area_km2 is None else area_km2
+                    # Latitude e longitude vêm sempre da mesma cidade
+                    if latitude is None or longitude is None:
+                        latitude, longitude = outra_lat, outra_lon
+                
+                cursor.executemany("DELETE FROM cidades WHERE id = ?", [(c[0],) for c in repetidas])
+                cursor.execute('''
+                    UPDATE cidades SET populacao = ?, area_km2 = ?, latitude = ?, longitude = ?
+                    WHERE id = ?
+                ''', (populacao, area_km2, latitude, longitude, mantida))
+                removidas += len(repetidas)
+            
+            self.cidades_duplicadas = self._criar_indice_unico_cidades(cursor)
+        return removidas
+    
+    def _gravar_cidades(self, cursor: sqlite3.Cursor, linhas: Iterable[Tuple[Any, ...]]) -> int:
+        """Grava (nome, estado_id, populacao, area_km2, latitude, longitude) com upsert e retorna quantas"""
+        if not self.cidades_duplicadas:
+            cursor.executemany(self.SQL_UPSERT_CIDADE, linhas)
+            return cursor.rowcount
+        
+        gravadas = 0
+        for nome, estado_id, *dados in linhas:
+            cursor.execute(self._ATUALIZAR_CIDADE, (*dados, nome, estado_id))
+            if not cursor.rowcount:
+                cursor.execute(self._INSERIR_CIDADE, (nome, estado_id, *dados))
+            gravadas += 1
+        return gravadas
+    
+    def insert_estado(self, nome: str, uf: str) -> int:
+        """Insere um novo estado e retorna o ID"""
+        with self.transacao() as cursor:
+            return self._inserir_estado(cursor, nome, uf)
+    
+    @staticmethod
+    def _inserir_estado(cursor: sqlite3.Cursor, nome: str, uf: str) -> int:
+        """Insere o estado se a UF ainda não existe e retorna o ID (no cursor de uma transação)"""
+        cursor.execute("INSERT OR IGNORE INTO estados (nome, uf) VALUES (?, ?)", (nome, uf))
+        if cursor.rowcount:
+            return cursor.lastrowid
+        
+        # Estado já existe, buscar o ID
+        cursor.execute("SELECT id FROM estados WHERE uf = ?", (uf,))
+        return cursor.fetchone()[0]
+    
+    def insert_cidade(self, nome: str, estado_uf: str, populacao: int = None, area_km2: float = None,
+                      latitude: float = None, longitude: float = None) -> int:
+        """Insere uma nova cidade (ou atualiza a existente no mesmo estado) e retorna o ID"""
+        with self.transacao() as cursor:
+            # Buscar ou criar estado
+            estado_id = self._inserir_estado(cursor, "", estado_uf)  # Nome será atualizado depois
+            
+            self._gravar_cidades(cursor, [(nome, estado_id, populacao, area_km2, latitude, longitude)])
+            cursor.execute("SELECT MIN(id) FROM cidades WHERE nome = ? AND estado_id = ?", (nome, estado_id))
+            return cursor.fetchone()[0]
+    
+    def inserir_cidades_lote(self, cidades: Iterable[Tuple[Any, ...]]) -> int:
+        """
+        Insere ou atualiza cidades em lote, em uma única transação
+        
+        As UFs são resolvidas uma única vez por um mapa em memória (estados novos
+        são criados sem nome) e as linhas vão para o banco com executemany.
+        
+        Args:
+            cidades: Tuplas (nome, uf, populacao, area_km2), opcionalmente seguidas
+                     de (latitude, longitude); pode ser um gerador
+        
+        Returns:
+            Quantidade de cidades gravadas
+        """
+        with self.transacao() as cursor:
+            estados = dict(cursor.execute("SELECT uf, id FROM estados").fetchall())
+            
+            def linhas():
+                for nome, uf, populacao, area_km2, *coordenadas in cidades:
+                    latitude, longitude = coordenadas or (None, None)
+                    uf = uf.strip().upper()
+                    if uf not in estados:
+                        estados[uf] = self._inserir_estado(cursor.connection.cursor(), "", uf)
+                    yield (nome, estados[uf], populacao, area_km2, latitude, longitude)
+            
+            return self._gravar_cidades(cursor, linhas())
+    
+    def importar_cidades_csv(self, arquivo: Union[str, IO], delimitador: str = ",") -> Dict[str, Any]:
+        """
+        Importa municípios de um CSV com as colunas nome, uf e, opcionalmente,
+        populacao, area_km2, latitude e longitude
+        
+        Cidades já cadastradas no mesmo estado são atualizadas em vez de duplicadas.
+        Linhas sem nome/UF ou com números inválidos são rejeitadas e o restante
+        é gravado em uma única transação.
+        
+        Args:
+            arquivo: Caminho ou arquivo aberto (texto ou binário)
+            delimitador: Separador das colunas
+        
+        Returns:
+            Dicionário com 'importadas', 'rejeitadas' e 'amostra_rejeitadas'
+            (as primeiras linhas rejeitadas, com número da linha e motivo)
+        """
+        resumo = {"importadas": 0, "rejeitadas": 0, "amostra_rejeitadas": []}
+        
+        def rejeitar(numero: int, motivo: str):
+            resumo['rejeitadas'] += 1
+            if len(resumo['amostra_rejeitadas']) < 100:
+                resumo['amostra_rejeitadas'].append({"linha": numero, "motivo": motivo})
+        
+        def numero_opcional(valor: Optional[str], tipo: type):
+            valor = (valor or "").strip()
+            return tipo(valor) if valor else None
+        
+        def cidades(leitor: csv.DictReader):
+            # Linha 1 é o cabeçalho
+            for numero, linha in enumerate(leitor, start=2):
+                nome = (linha.get('nome') or "").strip()
+                uf = (linha.get('uf') or "").strip()
+                if not nome or len(uf) != 2:
+                    rejeitar(numero, "nome ou uf ausente/inválido")
+                    continue
+                try:
+                    populacao = numero_opcional(linha.get('populacao'), int)
+                    area_km2 = numero_opcional(linha.get('area_km2'), float)
+                    latitude = numero_opcional(linha.get('latitude'), float)
+                    longitude = numero_opcional(linha.get('longitude'), float)
+                except ValueError:
+                    rejeitar(numero, "populacao, area_km2 ou coordenada inválida")
+                    continue
+                if (latitude is None) != (longitude is None) or (
+                        latitude is not None and not GeoProcessamento.validar_coordenadas(latitude, longitude)):
+                    rejeitar(numero, "latitude/longitude incompleta ou fora do intervalo")
+                    continue
+                yield (nome, uf, populacao, area_km2, latitude, longitude)
+        
+        with contextlib.ExitStack() as pilha:
+            if isinstance(arquivo, str):
+                arquivo = pilha.enter_context(open(arquivo, encoding='utf-8-sig', newline=''))
+            elif isinstance(arquivo.read(0), bytes):
+                arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+            
+            resumo['importadas'] = self.inserir_cidades_lote(cidades(csv.DictReader(arquivo, delimiter=delimitador)))
+        
+        return resumo
+    
+    def get_cidades(self, formato: str = "registros") -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """Retorna todas as cidades com informações do estado (formato: "registros" ou "dataframe")"""
+        return self._consultar('''
+            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
             FROM cidades c
             JOIN estados e ON c.estado_id = e.id
             ORDER BY c.nome
-        ''')
+        ''', formato=formato)
+    
+    def listar_cidades_pagina(self, tamanho: int = 50, apos: Optional[Tuple[Any, int]] = None,
+                              ordenar_por: str = "nome", decrescente: bool = False
+                              ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, int]]]:
+        """Retorna uma página de cidades por paginação por chave (seek) e o cursor da próxima página"""
+        if ordenar_por not in ("nome", "id"):
+            raise ValueError(f"Ordenação não suportada: {ordenar_por}")
         
-        colunas = [desc[0] for desc in cursor.description]
-        resultados = [dict(zip(colunas, row)) for row in cursor.fetchall()]
+        direcao = "DESC" if decrescente else "ASC"
+        operador = "<" if decrescente else ">"
         
-        conn.close()
-        return resultados
+        if ordenar_por == "nome":
+            chave = "(c.nome, c.id)"
+            ordem = f"c.nome {direcao}, c.id {direcao}"
+        else:
+            chave = "(c.id, c.id)"
+            ordem = f"c.id {direcao}"
+        
+        filtro = ""
+        parametros: list = []
+        if apos is not None:
+            filtro = f"WHERE {chave} {operador} (?, ?)"
+            parametros.extend(apos)
+        
+        # Uma linha a mais indica se existe próxima página
+        resultados = self._consultar(f'''
+            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
+            FROM cidades c
+            JOIN estados e ON c.estado_id = e.id
+            {filtro}
+            ORDER BY {ordem}
+            LIMIT ?
+        ''', (*parametros, tamanho + 1))
+        
+        proximo = None
+        if len(resultados) > tamanho:
+            resultados = resultados[:tamanho]
+            ultima = resultados[-1]
+            proximo = (ultima[ordenar_por], ultima['id'])
+        
+        return resultados, proximo
     
-    def get_cidade_by_id(self, cidade_id: int) -> Dict[str, Any]:
-        """Retorna uma cidade específica pelo ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def filtrar_cidades(self, uf: Optional[str] = None, prefixo: Optional[str] = None,
+                        populacao_min: Optional[int] = None, populacao_max: Optional[int] = None,
+                        area_min: Optional[float] = None, area_max: Optional[float] = None,
+                        ordenar_por: str = "nome", decrescente: bool = False,
+                        limite: int = 100, formato: str = "registros"
+                        ) -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """
+        Retorna as cidades que atendem a todos os filtros informados
         
-        cursor.execute('''
-            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2
+        Cada filtro é atendido por um índice (estado_id, nome sem diferenciar
+        maiúsculas, populacao, area_km2); filtros None são ignorados.
+        
+        Args:
+            uf: Sigla do estado
+            prefixo: Início do nome da cidade (sem diferenciar maiúsculas)
+            populacao_min: População mínima (inclusive)
+            populacao_max: População máxima (inclusive)
+            area_min: Área mínima em km² (inclusive)
+            area_max: Área máxima em km² (inclusive)
+            ordenar_por: "nome", "populacao", "area_km2" ou "id"
+            decrescente: Ordem decrescente
+            limite: Quantidade máxima de cidades (0 = sem limite)
+            formato: "registros" (lista de dicionários) ou "dataframe"
+        
+        Returns:
+            Cidades com informações do estado
+        """
+        sql, parametros = self._sql_filtrar_cidades(uf, prefixo, populacao_min, populacao_max,
+                                                    area_min, area_max, ordenar_por, decrescente, limite)
+        return self._consultar(sql, parametros, formato)
+    
+    def plano_filtrar_cidades(self, **filtros) -> List[str]:
+        """Retorna o EXPLAIN QUERY PLAN de filtrar_cidades com os mesmos argumentos (para conferir os índices)"""
+        sql, parametros = self._sql_filtrar_cidades(**filtros)
+        cursor = self._conexao().execute(f"EXPLAIN QUERY PLAN {sql}", parametros)
+        return [linha[3] for linha in cursor.fetchall()]
+    
+    def _sql_filtrar_cidades(self, uf: Optional[str] = None, prefixo: Optional[str] = None,
+                             populacao_min: Optional[int] = None, populacao_max: Optional[int] = None,
+                             area_min: Optional[float] = None, area_max: Optional[float] = None,
+                             ordenar_por: str = "nome", decrescente: bool = False,
+                             limite: int = 100) -> Tuple[str, tuple]:
+        """Monta o SELECT e os parâmetros de filtrar_cidades"""
+        if ordenar_por not in self.ORDENACOES_FILTRO:
+            raise ValueError(f"Ordenação não suportada: {ordenar_por}")
+        
+        condicoes = []
+        parametros: list = []
+        
+        if uf:
+            condicoes.append("e.uf = ?")
+            parametros.append(uf.strip().upper())
+        if prefixo:
+            # Curingas do LIKE no próprio prefixo são tratados como texto
+            escapado = prefixo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            condicoes.append("c.nome LIKE ? ESCAPE '\\'")
+            parametros.append(f"{escapado}%")
+        for coluna, operador, valor in (("c.populacao", ">=", populacao_min), ("c.populacao", "<=", populacao_max),
+                                        ("c.area_km2", ">=", area_min), ("c.area_km2", "<=", area_max)):
+            if valor is not None:
+                condicoes.append(f"{coluna} {operador} ?")
+                parametros.append(valor)
+        
+        filtro = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        direcao = "DESC" if decrescente else "ASC"
+        ordem = f"c.{ordenar_por} {direcao}" + (f", c.id {direcao}" if ordenar_por != "id" else "")
+        
+        sql = f'''
+            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
             FROM cidades c
             JOIN estados e ON c.estado_id = e.id
-            WHERE c.id = ?
-        ''', (cidade_id,))
+            {filtro}
+            ORDER BY {ordem}
+        '''
+        if limite:
+            sql += "LIMIT ?"
+            parametros.append(limite)
         
-        colunas = [desc[0] for desc in cursor.description]
-        resultado = cursor.fetchone()
+        return sql, tuple(parametros)
+    
+    def cidades_na_caixa(self, lat_min: float, lat_max: float,
+                         lon_min: float, lon_max: float) -> List[Dict[str, Any]]:
+        """Retorna as cidades dentro da caixa (lon_min > lon_max ou fora de ±180 cruza o antimeridiano)"""
+        cidades = []
+        for faixa_min, faixa_max in self._faixas_longitude(lon_min, lon_max):
+            # O R*Tree guarda float32 arredondado para fora: conferir nas colunas originais
+            cidades.extend(self._consultar('''
+                SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
+                FROM cidades_rtree r
+                JOIN cidades c ON c.id = r.id
+                JOIN estados e ON c.estado_id = e.id
+                WHERE r.lat_max >= ? AND r.lat_min <= ? AND r.lon_max >= ? AND r.lon_min <= ?
+                  AND c.latitude BETWEEN ? AND ? AND c.longitude BETWEEN ? AND ?
+            ''', (lat_min, lat_max, faixa_min, faixa_max, lat_min, lat_max, faixa_min, faixa_max)))
+        return cidades
+    
+    @staticmethod
+    def _faixas_longitude(lon_min: float, lon_max: float) -> List[Tuple[float, float]]:
+        """Divide uma faixa de longitude em faixas dentro de [-180, 180]"""
+        if lon_max - lon_min >= 360:
+            return [(-180.0, 180.0)]
         
-        conn.close()
+        # Normalizar o início para [-180, 180) e seguir a faixa no sentido leste
+        largura = (lon_max - lon_min) % 360
+        inicio = (lon_min + 180) % 360 - 180
+        fim = inicio + largura
+        if fim <= 180:
+            return [(inicio, fim)]
+        return [(inicio, 180.0), (-180.0, fim - 360)]
+    
+    def cidades_no_raio(self, latitude: float, longitude: float, raio_km: float,
+                        metodo: str = "geodesic") -> List[Dict[str, Any]]:
+        """
+        Retorna as cidades a até `raio_km` do ponto, da mais próxima para a mais distante
         
-        if resultado:
-            return dict(zip(colunas, resultado))
-        return None
+        O R*Tree seleciona as cidades da caixa delimitadora do círculo e a
+        distância exata é calculada só para elas pelo GeoProcessamento.
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            raio_km: Raio de busca em quilômetros
+            metodo: "geodesic" (padrão) ou "haversine"
+        
+        Returns:
+            Lista de cidades com 'distancia_km'
+        """
+        candidatas = self.cidades_na_caixa(*GeoProcessamento.calcular_bounding_box(latitude, longitude, raio_km))
+        if not candidatas:
+            return []
+        
+        distancias = GeoProcessamento.distancias_batch(
+            latitude, longitude,
+            [cidade['latitude'] for cidade in candidatas], [cidade['longitude'] for cidade in candidatas],
+            metodo=metodo
+        )
+        
+        proximas = []
+        for cidade, distancia in zip(candidatas, distancias):
+            if distancia <= raio_km:
+                cidade['distancia_km'] = round(float(distancia), 2)
+                proximas.append(cidade)
+        
+        proximas.sort(key=lambda cidade: cidade['distancia_km'])
+        return proximas
     
-    def get_estados(self) -> List[Dict[str, Any]]:
-        """Retorna todos os estados"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def cidades_mais_proximas(self, latitude: float, longitude: float, k: int = 1,
+                              raio_inicial_km: float = 50) -> List[Dict[str, Any]]:
+        """
+        Retorna as k cidades mais próximas do ponto (com 'distancia_km')
         
-        cursor.execute("SELECT id, nome, uf FROM estados ORDER BY nome")
+        O raio de busca dobra até o círculo conter k cidades: qualquer cidade
+        fora dele está mais longe do que todas as encontradas.
         
-        colunas = [desc[0] for desc in cursor.description]
-        resultados = [dict(zip(colunas, row)) for row in cursor.fetchall()]
+        Args:
+            latitude, longitude: Coordenadas do ponto
+            k: Quantidade de cidades
+            raio_inicial_km: Primeiro raio tentado
         
-        conn.close()
-        return resultados
+        Returns:
+            Lista com até k cidades, da mais próxima para a mais distante
+        """
+        # Metade da circunferência da Terra cobre o globo inteiro
+        raio_maximo = GeoProcessamento.distancia_haversine(0, 0, 0, 180) + 50
+        raio = raio_inicial_km
+        while True:
+            cidades = self.cidades_no_raio(latitude, longitude, raio)
+            if len(cidades) >= k or raio >= raio_maximo:
+                return cidades[:k]
+            raio = min(raio * 2, raio_maximo)
+    
+    def cidade_mais_proxima(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+        """Retorna a cidade mais próxima do ponto (com 'distancia_km'), ou None sem cidades com coordenadas"""
+        cidades = self.cidades_mais_proximas(latitude, longitude, k=1)
+        return cidades[0] if cidades else None
+    
+    def get_resumo_estados(self, formato: str = "registros") -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """Retorna, por estado com cidades, a quantidade, população, área e densidade (hab/km²)"""
+        return self._consultar('''
+            SELECT e.id, e.nome, e.uf, r.quantidade_cidades, r.populacao_total, r.area_total,
+                   CASE WHEN r.area_total > 0 THEN r.populacao_total / r.area_total END AS densidade
+            FROM estado_resumo r
+            JOIN estados e ON r.estado_id = e.id
+            WHERE r.quantidade_cidades > 0
+            ORDER BY e.uf
+        ''', formato=formato)
+    
+    def reconstruir_estado_resumo(self):
+        """Recalcula estado_resumo do zero a partir de cidades (ex.: após alterar o banco sem gatilhos)"""
+        with self.transacao() as cursor:
+            self._reconstruir_estado_resumo(cursor)
+    
+    @staticmethod
+    def _reconstruir_estado_resumo(cursor: sqlite3.Cursor):
+        """Recalcula estado_resumo no cursor de uma transação"""
+        cursor.execute("DELETE FROM estado_resumo")
+        cursor.execute('''
+            INSERT INTO estado_resumo (estado_id, quantidade_cidades, populacao_total, area_total)
+            SELECT estado_id, COUNT(*), COALESCE(SUM(populacao), 0), COALESCE(SUM(area_km2), 0)
+            FROM cidades
+            WHERE estado_id IS NOT NULL
+            GROUP BY estado_id
+        ''')
+    
+    def buscar_cidades(self, termo: str, limite: int = 10) -> List[Dict[str, Any]]:
+        """
+        Busca cidades pelo nome (ou estado/UF) ignorando acentos e maiúsculas
+        
+        Cada palavra do termo vale como prefixo ("joao pes" encontra "João
+        Pessoa") e os resultados vêm ordenados por relevância (bm25, com peso
+        maior no nome). Se nenhuma cidade tiver todas as palavras, a busca é
+        refeita exigindo qualquer uma delas e, por fim, só o início de cada
+        palavra, o que tolera erros de digitação no fim dos termos.
+        
+        Args:
+            termo: Texto digitado pelo usuário
+            limite: Quantidade máxima de cidades
+        
+        Returns:
+            Lista de cidades com informações do estado, da mais relevante à menos
+        """
+        palavras = re.findall(r"\w+", termo)
+        if not palavras:
+            return []
+        
+        curtas = [palavra[:3] for palavra in palavras]
+        tentativas = [
+            " AND ".join(f'"{palavra}"*' for palavra in palavras),
+            " OR ".join(f'"{palavra}"*' for palavra in palavras),
+            " OR ".join(f'"{palavra}"*' for palavra in dict.fromkeys(curtas)),
+        ]
+        
+        for consulta in dict.fromkeys(tentativas):
+            cidades = self._consultar('''
+                SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
+                FROM cidades_fts f
+                JOIN cidades c ON c.id = f.rowid
+                JOIN estados e ON c.estado_id = e.id
+                WHERE cidades_fts MATCH ?
+                ORDER BY bm25(cidades_fts, 10.0, 2.0, 1.0), c.populacao DESC
+                LIMIT ?
+            ''', (consulta, limite))
+            if cidades:
+                return cidades
+        
+        return []
+    
+    def get_cidade_by_id(self, cidade_id: int) -> Dict[str, Any]:
+        """Retorna uma cidade específica pelo ID"""
+        resultados = self._consultar('''
+            SELECT c.id, c.nome, e.nome as estado_nome, e.uf, c.populacao, c.area_km2, c.latitude, c.longitude
+            FROM cidades c
+            JOIN estados e ON c.estado_id = e.id
+            WHERE c.id = ?
+        ''', (cidade_id,))
+        
+        if resultados:
+            return resultados[0]
+        return None
+    
+    def get_estados(self, formato: str = "registros") -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """Retorna todos os estados (formato: "registros" ou "dataframe")"""
+        return self._consultar("SELECT id, nome, uf FROM estados ORDER BY nome", formato=formato)
     
     def populate_sample_data(self):
         """Popula o banco com dados de exemplo"""
@@ -142,22 +836,23 @@ class SQLiteDB:
         
         # Cidades de exemplo
         cidades_brasil = [
-            ("João Pessoa", "PB", 825796, 211.475),
-            ("Campina Grande", "PB", 413830, 620.223),
-            ("Recife", "PE", 1653461, 218.435),
-            ("Olinda", "PE", 393115, 41.681),
-            ("Fortaleza", "CE", 2703391, 312.353),
-            ("Natal", "RN", 890480, 167.264),
-            ("Maceió", "AL", 1025360, 511.149),
-            ("Aracaju", "SE", 664908, 181.857),
-            ("Salvador", "BA", 2886698, 693.453),
-            ("São Luís", "MA", 1115932, 834.785)
+            ("João Pessoa", "PB", 825796, 211.475, -7.1195, -34.8450),
+            ("Campina Grande", "PB", 413830, 620.223, -7.2307, -35.8817),
+            ("Recife", "PE", 1653461, 218.435, -8.0476, -34.8770),
+            ("Olinda", "PE", 393115, 41.681, -8.0089, -34.8553),
+            ("Fortaleza", "CE", 2703391, 312.353, -3.7319, -38.5267),
+            ("Natal", "RN", 890480, 167.264, -5.7945, -35.2110),
+            ("Maceió", "AL", 1025360, 511.149, -9.6498, -35.7089),
+            ("Aracaju", "SE", 664908, 181.857, -10.9472, -37.0731),
+            ("Salvador", "BA", 2886698, 693.453, -12.9714, -38.5014),
+            ("São Luís", "MA", 1115932, 834.785, -2.5307, -44.3068)
         ]
         
-        # Inserir estados
-        for nome, uf in estados_brasil:
-            self.insert_estado(nome, uf)
-        
-        # Inserir cidades
-        for nome, uf, populacao, area in cidades_brasil:
-            self.insert_cidade(nome, uf, populacao, area)
+        # Tudo em uma única transação
+        with self.transacao():
+            # Inserir estados
+            for nome, uf in estados_brasil:
+                self.insert_estado(nome, uf)
+            
+            # Inserir cidades
+            self.inserir_cidades_lote(cidades_brasil)
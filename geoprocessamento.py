@@ -1,6 +1,43 @@
 from geopy.distance import geodesic
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Sequence, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import itertools
 import math
+import os
+import threading
+import unicodedata
+import numpy as np
+
+# Raio médio da Terra em quilômetros (mesmo usado em distancia_haversine)
+RAIO_TERRA_KM = 6371.0
+
+# Parâmetros do elipsoide WGS-84 (o mesmo usado pelo geodesic do geopy)
+_WGS84_A = 6378.137
+_WGS84_F = 1 / 298.257223563
+_WGS84_B = (1 - _WGS84_F) * _WGS84_A
+
+# Menor raio de curvatura do WGS-84 (meridiano no equador), usado para que
+# as caixas de busca nunca fiquem menores que o raio geodésico pedido
+_RAIO_MINIMO_KM = _WGS84_A * (1 - _WGS84_F) ** 2
+
+# Diferença relativa máxima (com folga) entre haversine e geodesic
+_MARGEM_ELIPSOIDE = 0.01
+
+# Alfabeto base32 do geohash (em ordem ASCII, então prefixos viram intervalos)
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_GEOHASH_DIRECOES = {
+    'n': (1, 0), 'ne': (1, 1), 'e': (0, 1), 'se': (-1, 1),
+    's': (-1, 0), 'sw': (-1, -1), 'w': (0, -1), 'nw': (1, -1)
+}
+
+
+def normalizar_texto(texto: str) -> str:
+    """Remove acentos, ignora maiúsculas e espaços extras ("São  Luís" -> "sao luis")"""
+    decomposto = unicodedata.normalize('NFKD', texto or "")
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
 
 class GeoProcessamento:
     """Classe para operações de geoprocessamento"""
@@ -23,38 +60,143 @@ class GeoProcessamento:
     
     @staticmethod
     def locais_proximos(locais: List[Dict[str, Any]], lat_central: float, 
-                       lon_central: float, raio_km: float = 10) -> List[Dict[str, Any]]:
+                       lon_central: float, raio_km: float = 10,
+                       metodo: str = "geodesic",
+                       contadores: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """
         Encontra locais dentro de um raio específico de um ponto central
         
+        A filtragem é feita em camadas de precisão crescente: caixa
+        delimitadora, haversine e, só perto da borda do raio, o geodesic do
+        geopy. O resultado é o mesmo de calcular o geodesic para todos.
+        
         Args:
             locais: Lista de locais do MongoDB
             lat_central, lon_central: Coordenadas do ponto central
             raio_km: Raio de busca em quilômetros
+            metodo: "geodesic" (padrão) ou "haversine"
+            contadores: Dicionário opcional preenchido com quantos locais
+                        chegaram a cada camada do filtro
         
         Returns:
             Lista de locais próximos com distância calculada
         """
-        locais_proximos = []
+        indices, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
         
-        for local in locais:
-            if 'coordenadas' in local:
-                lat_local = local['coordenadas']['latitude']
-                lon_local = local['coordenadas']['longitude']
-                
-                distancia = GeoProcessamento.calcular_distancia(
-                    lat_central, lon_central, lat_local, lon_local
-                )
-                
-                if distancia <= raio_km:
-                    local_com_distancia = local.copy()
-                    local_com_distancia['distancia_km'] = round(distancia, 2)
-                    locais_proximos.append(local_com_distancia)
+        # Camada 1: caixa delimitadora (apenas comparações)
+        lat_min, lat_max, lon_min, lon_max = GeoProcessamento.calcular_bounding_box(
+            lat_central, lon_central, raio_km
+        )
+        na_caixa = (lats >= lat_min) & (lats <= lat_max)
+        if lon_max - lon_min < 360.0:
+            na_caixa &= ((lons - lon_min) % 360.0) <= (lon_max - lon_min)
+        candidatos = np.flatnonzero(na_caixa)
+        
+        # Camada 2: haversine vetorizado
+        haversine = GeoProcessamento.distancias_batch(
+            lat_central, lon_central, lats[candidatos], lons[candidatos], metodo="haversine"
+        )
+        
+        if metodo == "haversine":
+            dentro = candidatos[haversine <= raio_km]
+            distancias = haversine[haversine <= raio_km]
+            na_fronteira = 0
+        elif metodo == "geodesic":
+            # Camada 3: a diferença entre a esfera e o elipsoide não passa de
+            # ~0,6%; só os candidatos nessa faixa em torno do raio precisam do
+            # geodesic exato do geopy para decidir se entram
+            certos = haversine <= raio_km * (1 - _MARGEM_ELIPSOIDE)
+            fronteira = np.flatnonzero(~certos & (haversine <= raio_km * (1 + _MARGEM_ELIPSOIDE)))
+            na_fronteira = len(fronteira)
+            
+            exatas = np.array([
+                GeoProcessamento.calcular_distancia(lat_central, lon_central,
+                                                    lats[candidatos[i]], lons[candidatos[i]])
+                for i in fronteira
+            ], dtype=float)
+            aceitas = exatas <= raio_km
+            
+            dentro_certos = candidatos[certos]
+            dentro = np.concatenate([dentro_certos, candidatos[fronteira[aceitas]]])
+            distancias = np.concatenate([
+                GeoProcessamento.distancias_batch(lat_central, lon_central, lats[dentro_certos],
+                                                  lons[dentro_certos], metodo="geodesic"),
+                exatas[aceitas]
+            ])
+            
+            # Restaurar a ordem original dos documentos
+            ordem_original = np.argsort(dentro, kind='stable')
+            dentro = dentro[ordem_original]
+            distancias = distancias[ordem_original]
+        else:
+            raise ValueError(f"Método de distância desconhecido: {metodo}")
+        
+        if contadores is not None:
+            contadores.update({
+                'caixa_delimitadora': len(indices),
+                'haversine': len(candidatos),
+                'geodesic': na_fronteira,
+                'encontrados': len(dentro)
+            })
+        
+        distancias_arredondadas = np.round(distancias, 2)
+        
+        # Ordenar por distância (estável, preservando a ordem original em empates)
+        ordem = np.argsort(distancias_arredondadas, kind='stable')
+        
+        locais_proximos = []
+        for posicao in ordem:
+            local_com_distancia = locais[indices[dentro[posicao]]].copy()
+            local_com_distancia['distancia_km'] = float(distancias_arredondadas[posicao])
+            locais_proximos.append(local_com_distancia)
         
-        # Ordenar por distância
-        locais_proximos.sort(key=lambda x: x['distancia_km'])
         return locais_proximos
     
+    @staticmethod
+    def k_mais_proximos(locais: List[Dict[str, Any]], lat_central: float, lon_central: float,
+                        k: int = 5, categoria: str = None,
+                        metodo: str = "geodesic") -> List[Dict[str, Any]]:
+        """
+        Encontra os k locais mais próximos de um ponto, sem precisar de um raio
+        
+        Args:
+            locais: Lista de locais do MongoDB
+            lat_central, lon_central: Coordenadas do ponto central
+            k: Quantidade de locais desejada
+            categoria: Filtra por categoria (sem diferenciar maiúsculas e acentos)
+            metodo: "geodesic" (padrão) ou "haversine"
+        
+        Returns:
+            Lista com até k locais ordenados por distância
+        """
+        if categoria:
+            categoria = normalizar_texto(categoria)
+            locais = [local for local in locais
+                      if normalizar_texto(local.get('categoria', '')) == categoria]
+        
+        indices, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
+        if not indices or k <= 0:
+            return []
+        
+        distancias = GeoProcessamento.distancias_batch(
+            lat_central, lon_central, lats, lons, metodo=metodo
+        )
+        
+        # Seleção parcial em O(n): apenas os k menores são ordenados
+        if k < len(distancias):
+            selecionados = np.argpartition(distancias, k - 1)[:k]
+        else:
+            selecionados = np.arange(len(distancias))
+        selecionados = selecionados[np.argsort(distancias[selecionados], kind='stable')]
+        
+        resultado = []
+        for posicao in selecionados:
+            local_com_distancia = locais[indices[posicao]].copy()
+            local_com_distancia['distancia_km'] = round(float(distancias[posicao]), 2)
+            resultado.append(local_com_distancia)
+        
+        return resultado
+    
     @staticmethod
     def locais_por_cidade(locais: List[Dict[str, Any]], cidade: str) -> List[Dict[str, Any]]:
         """
@@ -69,23 +211,157 @@ class GeoProcessamento:
         """
         return [local for local in locais if local.get('cidade', '').lower() == cidade.lower()]
     
+    @staticmethod
+    def locais_em_poligono(locais: List[Dict[str, Any]], poligono: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Filtra os locais que estão dentro de um polígono
+        
+        O teste é o do raio (par-ímpar) no plano latitude/longitude, vetorizado
+        sobre os pontos e precedido por um corte pela caixa de cada polígono.
+        
+        Args:
+            locais: Lista de locais do MongoDB
+            poligono: Geometria GeoJSON (Polygon ou MultiPolygon, com buracos
+                      opcionais) ou Feature que a contenha; coordenadas em
+                      [longitude, latitude]
+        
+        Returns:
+            Lista de locais dentro do polígono
+        """
+        indices, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
+        dentro = np.zeros(len(indices), dtype=bool)
+        
+        for aneis in GeoProcessamento._poligonos_geojson(poligono):
+            exterior = np.asarray(aneis[0], dtype=float)
+            na_caixa = np.flatnonzero(
+                ~dentro &
+                (lons >= exterior[:, 0].min()) & (lons <= exterior[:, 0].max()) &
+                (lats >= exterior[:, 1].min()) & (lats <= exterior[:, 1].max())
+            )
+            if len(na_caixa) == 0:
+                continue
+            
+            # Os buracos entram na mesma contagem de cruzamentos
+            x = lons[na_caixa]
+            y = lats[na_caixa]
+            cruzamentos = np.zeros(len(na_caixa), dtype=bool)
+            for anel in aneis:
+                vertices = np.asarray(anel, dtype=float)
+                x1, y1 = vertices[:, 0], vertices[:, 1]
+                x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+                for a_x, a_y, b_x, b_y in zip(x1, y1, x2, y2):
+                    if a_y == b_y:
+                        continue
+                    atravessa = (a_y > y) != (b_y > y)
+                    cruzamentos ^= atravessa & (x < (b_x - a_x) * (y - a_y) / (b_y - a_y) + a_x)
+            
+            dentro[na_caixa] |= cruzamentos
+        
+        return [locais[indices[i]] for i in np.flatnonzero(dentro)]
+    
+    @staticmethod
+    def _poligonos_geojson(geometria: Dict[str, Any]) -> List[List[List[List[float]]]]:
+        """Normaliza Polygon/MultiPolygon/Feature GeoJSON em uma lista de polígonos (listas de anéis)"""
+        if geometria.get('type') == 'Feature':
+            geometria = geometria.get('geometry') or {}
+        
+        if geometria.get('type') == 'Polygon':
+            return [geometria['coordinates']]
+        if geometria.get('type') == 'MultiPolygon':
+            return list(geometria['coordinates'])
+        raise ValueError("O polígono deve ser uma geometria GeoJSON do tipo Polygon ou MultiPolygon")
+    
+    @staticmethod
+    def tamanho_celula_por_zoom(zoom: int) -> float:
+        """
+        Tamanho de célula de grade (em graus) adequado a um nível de zoom do mapa
+        
+        Args:
+            zoom: Nível de zoom do mapa (0 = mundo inteiro)
+        
+        Returns:
+            Lado da célula em graus (cerca de 8 células por tile de 256 px)
+        """
+        return 360.0 / (2 ** zoom) / 8
+    
+    @staticmethod
+    def agregar_grade(locais: Iterable[Dict[str, Any]], tamanho_celula: float) -> List[Dict[str, Any]]:
+        """
+        Agrega locais em uma grade fixa de latitude/longitude
+        
+        Args:
+            locais: Lista (ou cursor/gerador) de locais com coordenadas
+            tamanho_celula: Lado de cada célula em graus
+        
+        Returns:
+            Lista de células com limites, quantidade de locais e posição média
+        """
+        locais = list(locais)
+        _, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
+        if len(lats) == 0:
+            return []
+        
+        linhas = np.floor(lats / tamanho_celula).astype(np.int64)
+        colunas = np.floor(lons / tamanho_celula).astype(np.int64)
+        celulas, inversa, quantidades = np.unique(
+            np.stack([linhas, colunas], axis=1), axis=0, return_inverse=True, return_counts=True
+        )
+        inversa = inversa.ravel()
+        soma_lat = np.bincount(inversa, weights=lats)
+        soma_lon = np.bincount(inversa, weights=lons)
+        
+        return [
+            GeoProcessamento._celula_grade(int(linha), int(coluna), tamanho_celula, int(quantidade),
+                                           soma_lat[i] / quantidade, soma_lon[i] / quantidade)
+            for i, ((linha, coluna), quantidade) in enumerate(zip(celulas, quantidades))
+        ]
+    
+    @staticmethod
+    def _celula_grade(linha: int, coluna: int, tamanho_celula: float, quantidade: int,
+                      latitude: float, longitude: float) -> Dict[str, Any]:
+        """Monta o dicionário de uma célula agregada da grade"""
+        return {
+            'linha': linha,
+            'coluna': coluna,
+            'lat_min': linha * tamanho_celula,
+            'lat_max': (linha + 1) * tamanho_celula,
+            'lon_min': coluna * tamanho_celula,
+            'lon_max': (coluna + 1) * tamanho_celula,
+            'quantidade': quantidade,
+            'latitude': float(latitude),
+            'longitude': float(longitude)
+        }
+    
     @staticmethod
     def calcular_bounding_box(lat_central: float, lon_central: float, 
                             raio_km: float) -> Tuple[float, float, float, float]:
         """
         Calcula uma caixa delimitadora (bounding box) para otimizar consultas
         
+        A caixa sempre contém o círculo de busca: usa a extensão esférica exata
+        da longitude e o menor raio de curvatura do elipsoide. Quando o círculo
+        alcança um polo, a faixa de longitude é a volta completa.
+        
         Args:
             lat_central, lon_central: Coordenadas do ponto central
             raio_km: Raio em quilômetros
         
         Returns:
-            Tuple com (lat_min, lat_max, lon_min, lon_max)
+            Tuple com (lat_min, lat_max, lon_min, lon_max); lon_min/lon_max
+            podem ultrapassar ±180 quando o círculo cruza o antimeridiano
         """
-        # Aproximação: 1 grau de latitude ≈ 111 km
+        delta = raio_km / _RAIO_MINIMO_KM
+        lat_delta = math.degrees(delta)
+        
+        if lat_central - lat_delta <= -90 or lat_central + lat_delta >= 90 or delta >= math.pi / 2:
+            return (max(lat_central - lat_delta, -90.0), min(lat_central + lat_delta, 90.0),
+                    -180.0, 180.0)
+        
         # 1 grau de longitude varia com a latitude
-        lat_delta = raio_km / 111.0
-        lon_delta = raio_km / (111.0 * math.cos(math.radians(lat_central)))
+        seno = math.sin(delta) / math.cos(math.radians(lat_central))
+        if seno >= 1:
+            return (lat_central - lat_delta, lat_central + lat_delta, -180.0, 180.0)
+        lon_delta = math.degrees(math.asin(seno))
         
         return (
             lat_central - lat_delta,  # lat_min
@@ -95,64 +371,33 @@ class GeoProcessamento:
         )
     
     @staticmethod
-    def centroide(locais: List[Dict[str, Any]]) -> Tuple[float, float]:
+    def centroide(locais: Iterable[Dict[str, Any]]) -> Tuple[float, float]:
         """
         Calcula o centroide (centro de massa) de uma lista de locais
         
         Args:
-            locais: Lista de locais com coordenadas
+            locais: Lista (ou cursor/gerador) de locais com coordenadas
         
         Returns:
             Tuple com (latitude_centro, longitude_centro)
         """
-        if not locais:
-            return (0.0, 0.0)
-        
-        lat_total = 0.0
-        lon_total = 0.0
-        
-        for local in locais:
-            if 'coordenadas' in local:
-                lat_total += local['coordenadas']['latitude']
-                lon_total += local['coordenadas']['longitude']
-        
-        return (lat_total / len(locais), lon_total / len(locais))
+        return AcumuladorGeografico().consumir(locais).centroide()
     
     @staticmethod
-    def estatisticas_geograficas(locais: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def estatisticas_geograficas(locais: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Calcula estatísticas geográficas de uma lista de locais
         
+        Os locais são percorridos uma única vez, então um cursor do MongoDB
+        pode ser passado diretamente sem carregar a coleção na memória.
+        
         Args:
-            locais: Lista de locais com coordenadas
+            locais: Lista (ou cursor/gerador) de locais com coordenadas
         
         Returns:
             Dicionário com estatísticas
         """
-        if not locais:
-            return {}
-        
-        latitudes = []
-        longitudes = []
-        
-        for local in locais:
-            if 'coordenadas' in local:
-                latitudes.append(local['coordenadas']['latitude'])
-                longitudes.append(local['coordenadas']['longitude'])
-        
-        if not latitudes:
-            return {}
-        
-        return {
-            'total_locais': len(locais),
-            'latitude_media': sum(latitudes) / len(latitudes),
-            'longitude_media': sum(longitudes) / len(longitudes),
-            'latitude_min': min(latitudes),
-            'latitude_max': max(latitudes),
-            'longitude_min': min(longitudes),
-            'longitude_max': max(longitudes),
-            'centroide': (sum(latitudes) / len(latitudes), sum(longitudes) / len(longitudes))
-        }
+        return AcumuladorGeografico().consumir(locais).resultado()
     
     @staticmethod
     def validar_coordenadas(latitude: float, longitude: float) -> bool:
@@ -221,3 +466,982 @@ class GeoProcessamento:
         c = 2 * math.asin(math.sqrt(a))
         
         return R * c
+    
+    @staticmethod
+    def _extrair_coordenadas(locais: List[Dict[str, Any]]) -> Tuple[List[int], np.ndarray, np.ndarray]:
+        """
+        Extrai as coordenadas de uma lista de locais para arrays NumPy
+        
+        Args:
+            locais: Lista de locais do MongoDB
+        
+        Returns:
+            Tuple com (índices dos locais com coordenadas, latitudes, longitudes)
+        """
+        indices = [i for i, local in enumerate(locais) if 'coordenadas' in local]
+        lats = np.fromiter((locais[i]['coordenadas']['latitude'] for i in indices),
+                           dtype=float, count=len(indices))
+        lons = np.fromiter((locais[i]['coordenadas']['longitude'] for i in indices),
+                           dtype=float, count=len(indices))
+        return indices, lats, lons
+    
+    @staticmethod
+    def distancias_batch(lat: float, lon: float, lats: Sequence[float], lons: Sequence[float],
+                         metodo: str = "haversine") -> np.ndarray:
+        """
+        Calcula de uma só vez as distâncias de um ponto a vários outros pontos
+        
+        Args:
+            lat, lon: Coordenadas do ponto de referência
+            lats, lons: Arrays (ou sequências) com as coordenadas dos demais pontos
+            metodo: "haversine" (esfera, igual a distancia_haversine) ou
+                    "geodesic" (elipsoide WGS-84, igual a calcular_distancia)
+        
+        Returns:
+            Array NumPy com as distâncias em quilômetros
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        
+        if metodo == "haversine":
+            return GeoProcessamento._haversine_vetorizado(lat, lon, lats, lons)
+        if metodo == "geodesic":
+            return GeoProcessamento._geodesic_vetorizado(lat, lon, lats, lons)
+        raise ValueError(f"Método de distância desconhecido: {metodo}")
+    
+    @staticmethod
+    def _haversine_vetorizado(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        Versão vetorizada de distancia_haversine
+        """
+        lat1_rad = math.radians(lat)
+        lon1_rad = math.radians(lon)
+        lat2_rad = np.radians(lats)
+        lon2_rad = np.radians(lons)
+        
+        dlat = lat2_rad - lat1_rad
+        dlon = lon2_rad - lon1_rad
+        
+        a = (np.sin(dlat / 2) ** 2 +
+             math.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2)
+        c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        
+        return RAIO_TERRA_KM * c
+    
+    @staticmethod
+    def _geodesic_vetorizado(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray,
+                             max_iteracoes: int = 200) -> np.ndarray:
+        """
+        Distância no elipsoide WGS-84 pela fórmula inversa de Vincenty, vetorizada
+        
+        Concorda com o geodesic do geopy (algoritmo de Karney) em frações de
+        milímetro. Os poucos pares quase antipodais em que a iteração não
+        converge são recalculados individualmente com calcular_distancia.
+        """
+        f = _WGS84_F
+        
+        L = np.radians(lons - lon)
+        U1 = math.atan((1 - f) * math.tan(math.radians(lat)))
+        U2 = np.arctan((1 - f) * np.tan(np.radians(lats)))
+        sinU1, cosU1 = math.sin(U1), math.cos(U1)
+        sinU2, cosU2 = np.sin(U2), np.cos(U2)
+        
+        lam = L.copy()
+        convergiu = np.zeros(L.shape, dtype=bool)
+        sin_sigma = cos_sigma = sigma = cos2_alpha = cos_2sigma_m = np.zeros(L.shape)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for _ in range(max_iteracoes):
+                sin_lam = np.sin(lam)
+                cos_lam = np.cos(lam)
+                sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 +
+                                    (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+                cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+                sigma = np.arctan2(sin_sigma, cos_sigma)
+                
+                # Pontos coincidentes têm sin_sigma == 0
+                sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+                cos2_alpha = 1 - sin_alpha ** 2
+                
+                # Linhas sobre o equador têm cos2_alpha == 0
+                cos_2sigma_m = np.where(cos2_alpha == 0, 0.0,
+                                        cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+                C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+                lam_anterior = lam
+                lam = L + (1 - C) * f * sin_alpha * (
+                    sigma + C * sin_sigma * (
+                        cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+                
+                convergiu = np.abs(lam - lam_anterior) < 1e-12
+                if convergiu.all():
+                    break
+        
+        u2 = cos2_alpha * (_WGS84_A ** 2 - _WGS84_B ** 2) / _WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (
+            cos_2sigma_m + B / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+                B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        
+        distancias = _WGS84_B * A * (sigma - delta_sigma)
+        
+        # Fallback escalar para os casos em que Vincenty não converge
+        for i in np.flatnonzero(~convergiu | ~np.isfinite(distancias)):
+            distancias[i] = GeoProcessamento.calcular_distancia(lat, lon, lats[i], lons[i])
+        
+        return distancias
+    
+    @staticmethod
+    def agrupar_dbscan(locais: List[Dict[str, Any]], eps_km: float = 1.0, min_pontos: int = 5,
+                       processos: Optional[int] = None) -> List[int]:
+        """
+        Agrupa locais em clusters por densidade (DBSCAN com métrica haversine)
+        
+        Args:
+            locais: Lista de locais do MongoDB
+            eps_km: Distância máxima entre vizinhos em quilômetros
+            min_pontos: Vizinhos (incluindo o próprio ponto) para um ponto ser núcleo
+            processos: Número de processos (padrão: número de CPUs)
+        
+        Returns:
+            Lista com o cluster de cada local, na mesma ordem; -1 indica ruído
+            ou local sem coordenadas
+        """
+        indices, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
+        rotulos = [-1] * len(locais)
+        
+        for indice, rotulo in zip(indices, GeoProcessamento.dbscan_coordenadas(
+                lats, lons, eps_km, min_pontos, processos).tolist()):
+            rotulos[indice] = rotulo
+        
+        return rotulos
+    
+    @staticmethod
+    def dbscan_coordenadas(lats: Sequence[float], lons: Sequence[float], eps_km: float = 1.0,
+                           min_pontos: int = 5, processos: Optional[int] = None) -> np.ndarray:
+        """
+        DBSCAN sobre arrays de coordenadas
+        
+        Os vizinhos são encontrados em uma grade com células do tamanho de
+        eps_km, comparando apenas pontos de células adjacentes. Para entradas
+        grandes os blocos de células são distribuídos em um pool de processos.
+        
+        Args:
+            lats, lons: Coordenadas dos pontos
+            eps_km: Distância máxima entre vizinhos em quilômetros
+            min_pontos: Vizinhos (incluindo o próprio ponto) para um ponto ser núcleo
+            processos: Número de processos (padrão: número de CPUs)
+        
+        Returns:
+            Array com o cluster de cada ponto (-1 para ruído)
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        n = len(lats)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        
+        origem, destino = _pares_dbscan(lats, lons, eps_km, processos)
+        
+        vizinhos = np.bincount(origem, minlength=n) + np.bincount(destino, minlength=n) + 1
+        nucleo = vizinhos >= min_pontos
+        
+        # Componentes conexas entre pontos núcleo (ligação + compressão de caminhos)
+        pais = np.arange(n)
+        entre_nucleos = nucleo[origem] & nucleo[destino]
+        u, v = origem[entre_nucleos], destino[entre_nucleos]
+        while True:
+            pu, pv = pais[u], pais[v]
+            diferentes = pu != pv
+            if not diferentes.any():
+                break
+            np.minimum.at(pais, np.maximum(pu, pv)[diferentes], np.minimum(pu, pv)[diferentes])
+            while True:
+                comprimido = pais[pais]
+                if np.array_equal(comprimido, pais):
+                    break
+                pais = comprimido
+        
+        # Pontos de borda herdam o cluster de um núcleo vizinho
+        raizes = np.where(nucleo, pais, n)
+        for a, b in ((origem, destino), (destino, origem)):
+            borda = nucleo[a] & ~nucleo[b]
+            np.minimum.at(raizes, b[borda], pais[a[borda]])
+        
+        rotulos = np.full(n, -1, dtype=np.int64)
+        agrupados = raizes < n
+        if agrupados.any():
+            # Numerar os clusters na ordem em que aparecem
+            unicas, primeira, inversa = np.unique(raizes[agrupados], return_index=True,
+                                                  return_inverse=True)
+            numeracao = np.empty(len(unicas), dtype=np.int64)
+            numeracao[np.argsort(primeira, kind='stable')] = np.arange(len(unicas))
+            rotulos[agrupados] = numeracao[inversa]
+        
+        return rotulos
+    
+    @staticmethod
+    def geohash_codificar(latitude: float, longitude: float, precisao: int = 9) -> str:
+        """
+        Codifica uma coordenada em geohash
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto
+            precisao: Quantidade de caracteres (9 ≈ 5 metros)
+        
+        Returns:
+            Geohash do ponto
+        """
+        lat_min, lat_max = -90.0, 90.0
+        lon_min, lon_max = -180.0, 180.0
+        geohash = []
+        bits = 0
+        quantidade_bits = 0
+        par = True
+        
+        while len(geohash) < precisao:
+            # Bits alternados: longitude nos pares, latitude nos ímpares
+            if par:
+                meio = (lon_min + lon_max) / 2
+                if longitude >= meio:
+                    bits = (bits << 1) | 1
+                    lon_min = meio
+                else:
+                    bits <<= 1
+                    lon_max = meio
+            else:
+                meio = (lat_min + lat_max) / 2
+                if latitude >= meio:
+                    bits = (bits << 1) | 1
+                    lat_min = meio
+                else:
+                    bits <<= 1
+                    lat_max = meio
+            par = not par
+            
+            quantidade_bits += 1
+            if quantidade_bits == 5:
+                geohash.append(_GEOHASH_BASE32[bits])
+                bits = 0
+                quantidade_bits = 0
+        
+        return ''.join(geohash)
+    
+    @staticmethod
+    def geohash_limites(geohash: str) -> Tuple[float, float, float, float]:
+        """
+        Retorna a célula coberta por um geohash
+        
+        Args:
+            geohash: Geohash a decodificar
+        
+        Returns:
+            Tuple com (lat_min, lat_max, lon_min, lon_max)
+        """
+        lat_min, lat_max = -90.0, 90.0
+        lon_min, lon_max = -180.0, 180.0
+        par = True
+        
+        for caractere in geohash:
+            valor = _GEOHASH_BASE32.index(caractere)
+            for deslocamento in range(4, -1, -1):
+                bit = (valor >> deslocamento) & 1
+                if par:
+                    meio = (lon_min + lon_max) / 2
+                    if bit:
+                        lon_min = meio
+                    else:
+                        lon_max = meio
+                else:
+                    meio = (lat_min + lat_max) / 2
+                    if bit:
+                        lat_min = meio
+                    else:
+                        lat_max = meio
+                par = not par
+        
+        return (lat_min, lat_max, lon_min, lon_max)
+    
+    @staticmethod
+    def geohash_decodificar(geohash: str) -> Tuple[float, float]:
+        """
+        Decodifica um geohash para o centro da sua célula
+        
+        Args:
+            geohash: Geohash a decodificar
+        
+        Returns:
+            Tuple com (latitude, longitude)
+        """
+        lat_min, lat_max, lon_min, lon_max = GeoProcessamento.geohash_limites(geohash)
+        return ((lat_min + lat_max) / 2, (lon_min + lon_max) / 2)
+    
+    @staticmethod
+    def geohash_vizinhos(geohash: str) -> Dict[str, str]:
+        """
+        Retorna os geohashes vizinhos (mesma precisão) nas oito direções
+        
+        Args:
+            geohash: Geohash central
+        
+        Returns:
+            Dicionário direção ('n', 'ne', 'e', ...) -> geohash; direções além
+            dos polos são omitidas e a longitude dá a volta no antimeridiano
+        """
+        lat_min, lat_max, lon_min, lon_max = GeoProcessamento.geohash_limites(geohash)
+        altura = lat_max - lat_min
+        largura = lon_max - lon_min
+        lat_centro = (lat_min + lat_max) / 2
+        lon_centro = (lon_min + lon_max) / 2
+        
+        vizinhos = {}
+        for direcao, (d_lat, d_lon) in _GEOHASH_DIRECOES.items():
+            latitude = lat_centro + d_lat * altura
+            if not -90 < latitude < 90:
+                continue
+            longitude = (lon_centro + d_lon * largura + 180.0) % 360.0 - 180.0
+            vizinhos[direcao] = GeoProcessamento.geohash_codificar(latitude, longitude, len(geohash))
+        
+        return vizinhos
+    
+    @staticmethod
+    def geohash_prefixos_raio(latitude: float, longitude: float, raio_km: float,
+                              max_celulas: int = 16) -> List[str]:
+        """
+        Escolhe os prefixos de geohash que cobrem um círculo de busca
+        
+        Usa a maior precisão em que a caixa delimitadora do círculo é coberta
+        por no máximo `max_celulas` células.
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            raio_km: Raio de busca em quilômetros
+            max_celulas: Quantidade máxima de prefixos
+        
+        Returns:
+            Lista ordenada de prefixos ([''] quando o círculo cobre quase o globo)
+        """
+        lat_min, lat_max, lon_min, lon_max = GeoProcessamento.calcular_bounding_box(
+            latitude, longitude, raio_km
+        )
+        
+        for precisao in range(12, 0, -1):
+            bits_lat = (5 * precisao) // 2
+            bits_lon = 5 * precisao - bits_lat
+            altura = 180.0 / 2 ** bits_lat
+            largura = 360.0 / 2 ** bits_lon
+            
+            linha_min = int((lat_min + 90.0) // altura)
+            linha_max = min(int((lat_max + 90.0) // altura), 2 ** bits_lat - 1)
+            if lon_max - lon_min >= 360.0:
+                coluna_min, coluna_max = 0, 2 ** bits_lon - 1
+            else:
+                coluna_min = int((lon_min + 180.0) // largura)
+                coluna_max = min(int((lon_max + 180.0) // largura), coluna_min + 2 ** bits_lon - 1)
+            
+            if (linha_max - linha_min + 1) * (coluna_max - coluna_min + 1) > max_celulas:
+                continue
+            
+            colunas = {c % 2 ** bits_lon for c in range(coluna_min, coluna_max + 1)}
+            return sorted({
+                GeoProcessamento.geohash_codificar((linha + 0.5) * altura - 90.0,
+                                                   (coluna + 0.5) * largura - 180.0, precisao)
+                for linha in range(linha_min, linha_max + 1)
+                for coluna in colunas
+            })
+        
+        return ['']
+    
+    @staticmethod
+    def geohash_intervalos(latitude: float, longitude: float, raio_km: float,
+                           max_celulas: int = 16) -> List[Tuple[str, str]]:
+        """
+        Converte uma busca por raio em intervalos de geohash [inicio, fim)
+        
+        Cada intervalo é uma varredura de faixa em um índice B-tree comum
+        (MongoDB ou SQLite); prefixos consecutivos são unidos em um só.
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            raio_km: Raio de busca em quilômetros
+            max_celulas: Quantidade máxima de prefixos
+        
+        Returns:
+            Lista de tuplas (inicio, fim), com fim exclusivo
+        """
+        intervalos: List[Tuple[str, str]] = []
+        for prefixo in GeoProcessamento.geohash_prefixos_raio(latitude, longitude, raio_km, max_celulas):
+            fim = GeoProcessamento._geohash_sucessor(prefixo)
+            if intervalos and intervalos[-1][1] == prefixo:
+                intervalos[-1] = (intervalos[-1][0], fim)
+            else:
+                intervalos.append((prefixo, fim))
+        return intervalos
+    
+    @staticmethod
+    def _geohash_sucessor(prefixo: str) -> str:
+        """Menor string maior que todos os geohashes com o prefixo dado"""
+        caracteres = list(prefixo)
+        while caracteres:
+            posicao = _GEOHASH_BASE32.index(caracteres[-1])
+            if posicao < len(_GEOHASH_BASE32) - 1:
+                caracteres[-1] = _GEOHASH_BASE32[posicao + 1]
+                return ''.join(caracteres)
+            caracteres.pop()
+        # Depois de 'z' em ASCII
+        return '{'
+
+
+class AcumuladorGeografico:
+    """
+    Acumulador de estatísticas geográficas em uma única passada
+    
+    Mantém contagem, média, mínimo, máximo e variância (Welford) das
+    latitudes e longitudes sem guardar os pontos. Acumuladores de lotes ou
+    processos diferentes podem ser combinados com `mesclar`.
+    """
+    
+    def __init__(self, tamanho_lote: int = 10000):
+        """
+        Args:
+            tamanho_lote: Quantidade de pontos agrupados antes de cada atualização vetorizada
+        """
+        self.tamanho_lote = tamanho_lote
+        self.total_locais = 0
+        self.quantidade = 0
+        self.media = np.zeros(2)
+        self.m2 = np.zeros(2)
+        self.minimo = np.full(2, np.inf)
+        self.maximo = np.full(2, -np.inf)
+        self._pendentes: List[Tuple[float, float]] = []
+    
+    def adicionar(self, latitude: float, longitude: float):
+        """Adiciona um ponto ao acumulador"""
+        self._pendentes.append((latitude, longitude))
+        if len(self._pendentes) >= self.tamanho_lote:
+            self._descarregar()
+    
+    def adicionar_local(self, local: Dict[str, Any]):
+        """Adiciona um documento de local (documentos sem coordenadas só entram na contagem)"""
+        self.total_locais += 1
+        if 'coordenadas' in local:
+            self.adicionar(local['coordenadas']['latitude'], local['coordenadas']['longitude'])
+    
+    def consumir(self, locais: Iterable[Dict[str, Any]]) -> 'AcumuladorGeografico':
+        """
+        Consome uma lista, cursor ou gerador de locais
+        
+        Returns:
+            O próprio acumulador, para encadear chamadas
+        """
+        for local in locais:
+            self.adicionar_local(local)
+        self._descarregar()
+        return self
+    
+    def _descarregar(self):
+        """Incorpora os pontos pendentes como um lote"""
+        if not self._pendentes:
+            return
+        
+        pontos = np.array(self._pendentes, dtype=float)
+        self._pendentes = []
+        
+        lote = AcumuladorGeografico()
+        lote.quantidade = len(pontos)
+        lote.media = pontos.mean(axis=0)
+        lote.m2 = ((pontos - lote.media) ** 2).sum(axis=0)
+        lote.minimo = pontos.min(axis=0)
+        lote.maximo = pontos.max(axis=0)
+        self._combinar(lote)
+    
+    def _combinar(self, outro: 'AcumuladorGeografico'):
+        """Combina as estatísticas de outro acumulador (algoritmo de Chan)"""
+        if outro.quantidade == 0:
+            return
+        
+        quantidade = self.quantidade + outro.quantidade
+        delta = outro.media - self.media
+        self.media = self.media + delta * outro.quantidade / quantidade
+        self.m2 = self.m2 + outro.m2 + delta ** 2 * self.quantidade * outro.quantidade / quantidade
+        self.minimo = np.minimum(self.minimo, outro.minimo)
+        self.maximo = np.maximum(self.maximo, outro.maximo)
+        self.quantidade = quantidade
+    
+    def mesclar(self, outro: 'AcumuladorGeografico') -> 'AcumuladorGeografico':
+        """
+        Incorpora as estatísticas de outro acumulador (de outro lote ou processo)
+        
+        Returns:
+            O próprio acumulador, para encadear chamadas
+        """
+        self._descarregar()
+        outro._descarregar()
+        self.total_locais += outro.total_locais
+        self._combinar(outro)
+        return self
+    
+    def centroide(self) -> Tuple[float, float]:
+        """Retorna (latitude_centro, longitude_centro), ou (0.0, 0.0) sem pontos"""
+        self._descarregar()
+        if self.quantidade == 0:
+            return (0.0, 0.0)
+        return (float(self.media[0]), float(self.media[1]))
+    
+    def resultado(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas acumuladas
+        
+        Returns:
+            Dicionário com estatísticas (vazio se nenhum local tinha coordenadas)
+        """
+        self._descarregar()
+        if self.quantidade == 0:
+            return {}
+        
+        variancia = self.m2 / self.quantidade
+        return {
+            'total_locais': self.total_locais,
+            'locais_com_coordenadas': self.quantidade,
+            'latitude_media': float(self.media[0]),
+            'longitude_media': float(self.media[1]),
+            'latitude_min': float(self.minimo[0]),
+            'latitude_max': float(self.maximo[0]),
+            'longitude_min': float(self.minimo[1]),
+            'longitude_max': float(self.maximo[1]),
+            'latitude_desvio_padrao': float(math.sqrt(variancia[0])),
+            'longitude_desvio_padrao': float(math.sqrt(variancia[1])),
+            'centroide': self.centroide()
+        }
+
+
+class IndiceEspacial:
+    """
+    Índice espacial em grade de latitude/longitude para consultas por raio
+    
+    Os locais são distribuídos em células de `tamanho_celula` graus de latitude;
+    as colunas dividem os 360° de longitude em partes iguais de pelo menos
+    `tamanho_celula` graus, para que a coluna da emenda em ±180° não fique mais
+    estreita que as outras. Uma consulta visita apenas as células que cobrem o círculo de busca, de
+    modo que o custo depende da densidade local e não do tamanho da coleção.
+    """
+    
+    def __init__(self, tamanho_celula: float = 0.1):
+        """
+        Args:
+            tamanho_celula: Lado de cada célula da grade em graus
+        """
+        if tamanho_celula <= 0:
+            raise ValueError("O tamanho da célula deve ser positivo")
+        
+        self.tamanho_celula = tamanho_celula
+        # Arredondar para baixo (com folga para 360 / 0.1 = 3599.999...) mantém
+        # todas as colunas com a mesma largura, como em _pares_dbscan
+        self._colunas = max(1, int(math.floor(360.0 / tamanho_celula + 1e-9)))
+        self._largura_coluna = 360.0 / self._colunas
+        self._celulas: Dict[Tuple[int, int], Dict[str, Dict[str, Any]]] = {}
+        self._celula_por_id: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.RLock()
+    
+    @classmethod
+    def construir(cls, locais: List[Dict[str, Any]], tamanho_celula: float = 0.1) -> 'IndiceEspacial':
+        """
+        Constrói um índice a partir de uma lista de locais do MongoDB
+        
+        Args:
+            locais: Lista de locais com '_id' e coordenadas
+            tamanho_celula: Lado de cada célula da grade em graus
+        
+        Returns:
+            Índice preenchido
+        """
+        indice = cls(tamanho_celula)
+        for local in locais:
+            indice.inserir(local)
+        return indice
+    
+    def __len__(self) -> int:
+        return len(self._celula_por_id)
+    
+    def __contains__(self, local_id: str) -> bool:
+        return str(local_id) in self._celula_por_id
+    
+    def _celula(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """Retorna a célula (linha, coluna) que contém a coordenada"""
+        linha = int(math.floor(latitude / self.tamanho_celula))
+        coluna = int(math.floor(((longitude + 180.0) % 360.0) / self._largura_coluna)) % self._colunas
+        return (linha, coluna)
+    
+    def inserir(self, local: Dict[str, Any]) -> bool:
+        """
+        Insere (ou reposiciona) um local no índice
+        
+        Args:
+            local: Documento com '_id' e coordenadas
+        
+        Returns:
+            True se o local foi indexado, False se não possui coordenadas
+        """
+        if 'coordenadas' not in local or '_id' not in local:
+            return False
+        
+        local_id = str(local['_id'])
+        celula = self._celula(local['coordenadas']['latitude'], local['coordenadas']['longitude'])
+        
+        with self._lock:
+            self.remover(local_id)
+            self._celulas.setdefault(celula, {})[local_id] = local
+            self._celula_por_id[local_id] = celula
+        return True
+    
+    def remover(self, local_id: str) -> bool:
+        """
+        Remove um local do índice
+        
+        Args:
+            local_id: ID do local
+        
+        Returns:
+            True se o local estava indexado
+        """
+        local_id = str(local_id)
+        
+        with self._lock:
+            celula = self._celula_por_id.pop(local_id, None)
+            if celula is None:
+                return False
+            
+            conteudo = self._celulas[celula]
+            del conteudo[local_id]
+            if not conteudo:
+                del self._celulas[celula]
+        return True
+    
+    def _celulas_na_caixa(self, lat_min: float, lat_max: float,
+                          lon_min: float, lon_max: float) -> List[Tuple[int, int]]:
+        """Lista as células ocupadas que intersectam a caixa delimitadora"""
+        linha_min = int(math.floor(lat_min / self.tamanho_celula))
+        linha_max = int(math.floor(lat_max / self.tamanho_celula))
+        
+        if lon_max - lon_min >= 360.0:
+            colunas = None
+        else:
+            coluna_min = self._celula(0.0, lon_min)[1]
+            total = int(math.floor((lon_max - lon_min) / self._largura_coluna)) + 2
+            colunas = {(coluna_min + k) % self._colunas for k in range(min(total, self._colunas))}
+        
+        quantidade = (linha_max - linha_min + 1) * (len(colunas) if colunas is not None else self._colunas)
+        
+        # Para caixas enormes é mais barato percorrer só as células ocupadas
+        if quantidade > len(self._celulas):
+            return [
+                (linha, coluna) for linha, coluna in self._celulas
+                if linha_min <= linha <= linha_max and (colunas is None or coluna in colunas)
+            ]
+        
+        if colunas is None:
+            colunas = range(self._colunas)
+        return [
+            (linha, coluna)
+            for linha in range(linha_min, linha_max + 1)
+            for coluna in colunas
+            if (linha, coluna) in self._celulas
+        ]
+    
+    def candidatos(self, latitude: float, longitude: float, raio_km: float) -> List[Dict[str, Any]]:
+        """
+        Retorna os locais das células que cobrem o círculo de busca (sem filtrar distância)
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            raio_km: Raio de busca em quilômetros
+        
+        Returns:
+            Lista de locais candidatos
+        """
+        caixa = GeoProcessamento.calcular_bounding_box(latitude, longitude, raio_km)
+        
+        with self._lock:
+            return [
+                local
+                for celula in self._celulas_na_caixa(*caixa)
+                for local in self._celulas[celula].values()
+            ]
+    
+    def consultar_raio(self, latitude: float, longitude: float, raio_km: float = 10,
+                       metodo: str = "geodesic",
+                       contadores: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Encontra locais dentro de um raio usando apenas as células próximas
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            raio_km: Raio de busca em quilômetros
+            metodo: "geodesic" (padrão) ou "haversine"
+            contadores: Dicionário opcional preenchido com quantos locais
+                        chegaram a cada camada do filtro
+        
+        Returns:
+            Lista de locais próximos com distância calculada, igual a
+            GeoProcessamento.locais_proximos
+        """
+        return GeoProcessamento.locais_proximos(
+            self.candidatos(latitude, longitude, raio_km),
+            latitude, longitude, raio_km, metodo=metodo, contadores=contadores
+        )
+    
+    def k_mais_proximos(self, latitude: float, longitude: float, k: int = 5,
+                        categoria: str = None, metodo: str = "geodesic") -> List[Dict[str, Any]]:
+        """
+        Encontra os k locais mais próximos percorrendo a grade em anéis
+        
+        As células são visitadas em anéis concêntricos a partir da célula do
+        ponto central, mantendo um heap limitado aos k melhores. A busca para
+        assim que nenhuma célula ainda não visitada pode conter um local mais
+        próximo que o k-ésimo encontrado, de modo que o custo acompanha k e a
+        densidade local, e não o tamanho da coleção.
+        
+        Args:
+            latitude, longitude: Coordenadas do ponto central
+            k: Quantidade de locais desejada
+            categoria: Filtra por categoria (sem diferenciar maiúsculas e acentos)
+            metodo: "geodesic" (padrão) ou "haversine"
+        
+        Returns:
+            Lista com até k locais ordenados por distância
+        """
+        if k <= 0:
+            return []
+        
+        categoria = normalizar_texto(categoria) if categoria else None
+        # Heap de máximo (distâncias negativas) com os k melhores até agora
+        heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        desempate = itertools.count()
+        visitadas = set()
+        
+        def visitar(celula: Tuple[int, int]):
+            visitadas.add(celula)
+            conteudo = self._celulas.get(celula)
+            if not conteudo:
+                return
+            
+            locais = [local for local in conteudo.values()
+                      if categoria is None or normalizar_texto(local.get('categoria', '')) == categoria]
+            if not locais:
+                return
+            
+            _, lats, lons = GeoProcessamento._extrair_coordenadas(locais)
+            distancias = GeoProcessamento.distancias_batch(latitude, longitude, lats, lons, metodo=metodo)
+            for local, distancia in zip(locais, distancias.tolist()):
+                item = (-distancia, next(desempate), local)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif distancia < -heap[0][0]:
+                    heapq.heapreplace(heap, item)
+        
+        with self._lock:
+            linha0, coluna0 = self._celula(latitude, longitude)
+            lon_relativa = (longitude + 180.0) % 360.0
+            linha_min = int(math.floor(-90.0 / self.tamanho_celula))
+            linha_max = int(math.floor(90.0 / self.tamanho_celula))
+            cos_lat = math.cos(math.radians(latitude))
+            
+            raio_anel = 0
+            while True:
+                # Quando o anel passa a custar mais que as células ocupadas
+                # restantes, visita-se diretamente todas elas e encerra
+                if (2 * raio_anel + 1) ** 2 > len(self._celulas):
+                    for celula in list(self._celulas):
+                        if celula not in visitadas:
+                            visitar(celula)
+                    break
+                
+                for linha in range(linha0 - raio_anel, linha0 + raio_anel + 1):
+                    if linha < linha_min or linha > linha_max:
+                        continue
+                    borda = abs(linha - linha0) == raio_anel
+                    passo = 1 if borda else 2 * raio_anel
+                    for deslocamento in range(-raio_anel, raio_anel + 1, max(passo, 1)):
+                        celula = (linha, (coluna0 + deslocamento) % self._colunas)
+                        if celula not in visitadas:
+                            visitar(celula)
+                
+                # Limite inferior da distância a qualquer célula fora da região visitada
+                lado_sul = latitude - (linha0 - raio_anel) * self.tamanho_celula
+                lado_norte = (linha0 + raio_anel + 1) * self.tamanho_celula - latitude
+                if linha0 - raio_anel <= linha_min and linha0 + raio_anel >= linha_max:
+                    limite_lat = math.inf
+                else:
+                    limite_lat = _RAIO_MINIMO_KM * math.radians(min(
+                        lado_sul if linha0 - raio_anel > linha_min else math.inf,
+                        lado_norte if linha0 + raio_anel < linha_max else math.inf
+                    ))
+                
+                if 2 * raio_anel + 1 >= self._colunas:
+                    limite_lon = math.inf
+                else:
+                    oeste = lon_relativa - (coluna0 - raio_anel) * self._largura_coluna
+                    leste = (coluna0 + raio_anel + 1) * self._largura_coluna - lon_relativa
+                    # Distância até o grande círculo que contém o meridiano de borda
+                    seno = min(abs(math.sin(math.radians(min(oeste, leste)))) * cos_lat, 1.0)
+                    limite_lon = _RAIO_MINIMO_KM * math.asin(seno)
+                
+                limite = min(limite_lat, limite_lon)
+                if limite == math.inf:
+                    break
+                # Margem para a diferença entre a esfera e o elipsoide
+                if len(heap) == k and -heap[0][0] <= limite * 0.99:
+                    break
+                
+                raio_anel += 1
+        
+        resultado = []
+        for distancia_negativa, _, local in sorted(heap, key=lambda item: (-item[0], item[1])):
+            local_com_distancia = local.copy()
+            local_com_distancia['distancia_km'] = round(-distancia_negativa, 2)
+            resultado.append(local_com_distancia)
+        
+        return resultado
+
+
+# Limite de pares candidatos avaliados de uma vez (controla o uso de memória)
+_PARES_POR_BLOCO = 2_000_000
+
+# A partir deste número de pontos o DBSCAN usa um pool de processos
+_MINIMO_PONTOS_PARALELO = 50_000
+
+_DADOS_TRABALHADOR: Dict[str, np.ndarray] = {}
+
+
+def _pares_dbscan(lats: np.ndarray, lons: np.ndarray, eps_km: float,
+                  processos: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encontra todos os pares de pontos a no máximo eps_km (haversine)
+    
+    Returns:
+        Tuple com (origem, destino), índices dos pares com origem != destino,
+        cada par aparecendo uma única vez
+    """
+    delta = eps_km / RAIO_TERRA_KM
+    altura = math.degrees(delta) * (1 + 1e-9)
+    
+    # Largura das colunas: a maior diferença de longitude entre vizinhos,
+    # avaliada na latitude mais extrema dos pontos
+    lat_extrema = min(float(np.abs(lats).max()) + altura, 90.0)
+    cos_extremo = math.cos(math.radians(lat_extrema))
+    if cos_extremo <= 0 or math.sin(delta) / cos_extremo >= 1:
+        colunas = 1
+    else:
+        largura = math.degrees(math.asin(math.sin(delta) / cos_extremo)) * (1 + 1e-9)
+        colunas = max(1, int(360.0 // largura))
+    
+    linha = np.floor(lats / altura).astype(np.int64)
+    coluna = np.floor(((lons + 180.0) % 360.0) / (360.0 / colunas)).astype(np.int64) % colunas
+    chave = (linha - linha.min()) * colunas + coluna
+    
+    ordem = np.argsort(chave, kind='stable')
+    chaves, inicios, quantidades = np.unique(chave[ordem], return_index=True, return_counts=True)
+    linhas, cols = np.divmod(chaves, colunas)
+    
+    # Pares de células: a própria célula e as vizinhas de chave maior
+    deslocamentos_coluna = sorted({d % colunas for d in (-1, 0, 1)})
+    celula_a = [np.arange(len(chaves))]
+    celula_b = [np.arange(len(chaves))]
+    for dl in (-1, 0, 1):
+        for dc in deslocamentos_coluna:
+            if dl == 0 and dc == 0:
+                continue
+            alvo = (linhas + dl) * colunas + (cols + dc) % colunas
+            posicao = np.minimum(np.searchsorted(chaves, alvo), len(chaves) - 1)
+            valido = (linhas + dl >= 0) & (chaves[posicao] == alvo) & (alvo > chaves)
+            celula_a.append(np.flatnonzero(valido))
+            celula_b.append(posicao[valido])
+    celula_a = np.concatenate(celula_a)
+    celula_b = np.concatenate(celula_b)
+    
+    lat_rad = np.radians(lats[ordem])
+    dados = {
+        'lat': lat_rad,
+        'lon': np.radians(lons[ordem]),
+        'cos': np.cos(lat_rad),
+        'limite': np.array(math.sin(delta / 2) ** 2)
+    }
+    tarefas = _blocos_de_pares(inicios[celula_a], quantidades[celula_a],
+                               inicios[celula_b], quantidades[celula_b], celula_a == celula_b)
+    
+    processos = processos or os.cpu_count() or 1
+    if processos > 1 and len(lats) >= _MINIMO_PONTOS_PARALELO and len(tarefas) > 1:
+        with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_trabalhador,
+                                 initargs=(dados,)) as executor:
+            resultados = list(executor.map(_pares_do_bloco, tarefas))
+    else:
+        resultados = [_pares_do_bloco(tarefa, dados) for tarefa in tarefas]
+    
+    if not resultados:
+        vazio = np.zeros(0, dtype=np.int64)
+        return vazio, vazio
+    
+    # Voltar dos índices ordenados por célula para os índices originais
+    origem = ordem[np.concatenate([r[0] for r in resultados])]
+    destino = ordem[np.concatenate([r[1] for r in resultados])]
+    return origem, destino
+
+
+def _blocos_de_pares(inicio_a: np.ndarray, qtd_a: np.ndarray, inicio_b: np.ndarray,
+                     qtd_b: np.ndarray, mesma: np.ndarray) -> List[Tuple[np.ndarray, ...]]:
+    """Divide os pares de células em blocos de até _PARES_POR_BLOCO pares de pontos"""
+    # Células muito densas são fatiadas para que nenhum bloco estoure o limite
+    fatias = np.maximum(1, _PARES_POR_BLOCO // np.maximum(qtd_b, 1))
+    partes = -(-qtd_a // fatias)
+    repeticao = np.repeat(np.arange(len(qtd_a)), partes)
+    parte = np.arange(len(repeticao)) - np.repeat(np.cumsum(partes) - partes, partes)
+    
+    deslocamento = parte * fatias[repeticao]
+    inicio_a = inicio_a[repeticao] + deslocamento
+    qtd_a = np.minimum(fatias[repeticao], qtd_a[repeticao] - deslocamento)
+    inicio_b, qtd_b, mesma = inicio_b[repeticao], qtd_b[repeticao], mesma[repeticao]
+    
+    custo = np.cumsum(qtd_a * qtd_b)
+    cortes = np.searchsorted(custo, np.arange(_PARES_POR_BLOCO, int(custo[-1]) if len(custo) else 0,
+                                              _PARES_POR_BLOCO))
+    limites = [0] + np.unique(cortes).tolist() + [len(custo)]
+    
+    return [
+        (inicio_a[i:j], qtd_a[i:j], inicio_b[i:j], qtd_b[i:j], mesma[i:j])
+        for i, j in zip(limites[:-1], limites[1:]) if j > i
+    ]
+
+
+def _inicializar_trabalhador(dados: Dict[str, np.ndarray]):
+    """Guarda as coordenadas em cada processo do pool (enviadas uma única vez)"""
+    _DADOS_TRABALHADOR.update(dados)
+
+
+def _pares_do_bloco(tarefa: Tuple[np.ndarray, ...],
+                    dados: Optional[Dict[str, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Compara todos os pontos de cada par de células do bloco e devolve os vizinhos"""
+    dados = dados if dados is not None else _DADOS_TRABALHADOR
+    inicio_a, qtd_a, inicio_b, qtd_b, mesma = tarefa
+    
+    tamanhos = qtd_a * qtd_b
+    total = int(tamanhos.sum())
+    if total == 0:
+        vazio = np.zeros(0, dtype=np.int64)
+        return vazio, vazio
+    
+    k = np.arange(total) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    largura = np.repeat(qtd_b, tamanhos)
+    i = np.repeat(inicio_a, tamanhos) + k // largura
+    j = np.repeat(inicio_b, tamanhos) + k % largura
+    
+    # Dentro da mesma célula cada par é considerado uma só vez
+    manter = ~np.repeat(mesma, tamanhos) | (i < j)
+    i, j = i[manter], j[manter]
+    
+    lat, lon, cos = dados['lat'], dados['lon'], dados['cos']
+    a = (np.sin((lat[j] - lat[i]) / 2) ** 2 +
+         cos[i] * cos[j] * np.sin((lon[j] - lon[i]) / 2) ** 2)
+    vizinhos = a <= dados['limite']
+    
+    return i[vizinhos], j[vizinhos]
@@ -27,6 +27,10 @@ db.locais.insertMany([
       "latitude": -7.11532,
       "longitude": -34.861
     },
+    "location": {
+      "type": "Point",
+      "coordinates": [-34.861, -7.11532]
+    },
     "descricao": "Ponto turístico central da cidade.",
     "categoria": "Praça",
     "endereco": "Centro, João Pessoa - PB",
@@ -40,6 +44,10 @@ db.locais.insertMany([
       "latitude": -7.14111,
       "longitude": -34.7947
     },
+    "location": {
+      "type": "Point",
+      "coordinates": [-34.7947, -7.14111]
+    },
     "descricao": "Ponto mais oriental das Américas.",
     "categoria": "Ponto Turístico",
     "endereco": "Cabo Branco, João Pessoa - PB",
@@ -53,6 +61,10 @@ db.locais.insertMany([
       "latitude": -8.04756,
       "longitude": -34.8770
     },
+    "location": {
+      "type": "Point",
+      "coordinates": [-34.8770, -8.04756]
+    },
     "descricao": "Marco zero de Recife, centro histórico.",
     "categoria": "Ponto Turístico",
     "endereco": "Recife Antigo, Recife - PE",
@@ -66,6 +78,10 @@ db.locais.insertMany([
       "latitude": -3.73111,
       "longitude": -38.5264
     },
+    "location": {
+      "type": "Point",
+      "coordinates": [-38.5264, -3.73111]
+    },
     "descricao": "Centro cultural e de arte de Fortaleza.",
     "categoria": "Cultura",
     "endereco": "Praia de Iracema, Fortaleza - CE",
@@ -74,4 +90,9 @@ db.locais.insertMany([
   }
 ]);
 
+// Índice geoespacial usado pelas consultas por proximidade
+db.locais.createIndex({ location: "2dsphere" }, { name: "location_2dsphere" });
+// O campo geohash é preenchido pela aplicação na inicialização
+db.locais.createIndex({ geohash: 1 }, { name: "geohash" });
+
 print('Banco de dados inicializado com sucesso!');